@@ -0,0 +1,57 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A benchmark suite for the Memory class, based on synthetic traces (see source/replay.py).
+
+Each trace kind is replayed against a fresh Memory instance for each heap size, and the throughput, latency,
+fragmentation and failure rate of the replay are reported, together with the time taken by a full defrag once the replay
+has finished. Run with --help for the available options; by default the largest heap is 10M registers.
+"""
+
+import sys
+import os.path
+import argparse
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from source.memory import Memory
+from source.replay import TRACE_KINDS, replay, synthetic_trace
+
+HEAP_SIZES = (64, 4096, 262144, 10000000)
+STACK_SIZE = 5
+
+
+def run(heap_sizes, kinds, ops, policy, store, max_size):
+    """ Runs the suite, printing a line of results for each combination of heap size and trace kind. """
+    print("{:>10} {:>10} {:>12} {:>9} {:>9} {:>9} {:>7} {:>8} {:>11}".format(
+        "heap", "trace", "ops/sec", "p50 ns", "p99 ns", "max ns", "frag", "failed", "defrag ms"))
+    for heap_size in heap_sizes:
+        live = max(2, min(4096, heap_size // (max_size * 2)))
+        for kind in kinds:
+            events = synthetic_trace(kind, ops, max_size=max_size, live=live)
+            memory = Memory(size=heap_size + STACK_SIZE, heap_ptr=STACK_SIZE, store=store, policy=policy,
+                            log_capacity=0)
+            report = replay(memory, events)
+
+            started = time.perf_counter()
+            memory.defrag()
+            defrag_ms = (time.perf_counter() - started) * 1000
+
+            print("{:>10} {:>10} {:>12.0f} {:>9} {:>9} {:>9} {:>7.3f} {:>8.2%} {:>11.2f}".format(
+                heap_size, kind, report.ops_per_sec, report.latency_ns["p50"], report.latency_ns["p99"],
+                report.latency_ns["max"], report.peak_fragmentation, report.failure_rate, defrag_ms))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the Memory class against synthetic traces.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=HEAP_SIZES, help="the heap sizes to benchmark")
+    parser.add_argument("--kinds", nargs="+", default=TRACE_KINDS, choices=TRACE_KINDS, help="the traces to replay")
+    parser.add_argument("--ops", type=int, default=20000, help="the number of calls in each trace")
+    parser.add_argument("--max-size", type=int, default=16, help="the largest request size in each trace")
+    parser.add_argument("--policy", default="first-fit", help="the allocation policy to benchmark")
+    parser.add_argument("--store", default="list", help="the register store to benchmark")
+    args = parser.parse_args()
+    run(args.sizes, args.kinds, args.ops, args.policy, args.store, args.max_size)
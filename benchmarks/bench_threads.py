@@ -0,0 +1,66 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" Measures how the throughput of ShardedMemory scales with the number of threads.
+
+Each thread replays its own random mix of alloc and deAlloc calls. The same workload is run against a ShardedMemory with
+a single shard (equivalent to a Memory guarded by one global lock) and against one with a shard per thread. Note that
+under an interpreter with a global interpreter lock, pure-Python threads cannot run in parallel, so the sharded figures
+mostly reflect reduced lock contention rather than true parallel speed-up.
+"""
+
+import sys
+import os.path
+import argparse
+import random
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from source.sharded import ShardedMemory
+
+STACK_SIZE = 5
+
+
+def worker(memory, ops, seed):
+    """ Makes `ops` random alloc and deAlloc calls to `memory`, releasing everything still held at the end. """
+    rng = random.Random(seed)
+    held = []
+    for _ in range(0, ops):
+        if held and rng.random() < 0.45:
+            memory.deAlloc(held.pop(rng.randrange(0, len(held))))
+        else:
+            ptr = memory.alloc(rng.randint(1, 16))
+            if ptr is not None:
+                held.append(ptr)
+    for ptr in held:
+        memory.deAlloc(ptr)
+
+
+def measure(threads, shards, heap_size, ops):
+    """ Returns the number of calls per second achieved by `threads` threads sharing a memory with `shards` shards. """
+    memory = ShardedMemory(size=heap_size + STACK_SIZE, heap_ptr=STACK_SIZE, shards=shards, log_capacity=0)
+    workers = [threading.Thread(target=worker, args=(memory, ops, seed)) for seed in range(0, threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures ShardedMemory throughput against the number of threads.")
+    parser.add_argument("--threads", type=int, nargs="+", default=(1, 2, 4, 8), help="the thread counts to measure")
+    parser.add_argument("--heap", type=int, default=1 << 20, help="the size of the heap")
+    parser.add_argument("--ops", type=int, default=20000, help="the number of calls made by each thread")
+    args = parser.parse_args()
+
+    print("{:>8} {:>16} {:>16} {:>8}".format("threads", "1 shard ops/s", "sharded ops/s", "ratio"))
+    for threads in args.threads:
+        single = measure(threads, 1, args.heap, args.ops)
+        sharded = measure(threads, threads, args.heap, args.ops)
+        print("{:>8} {:>16.0f} {:>16.0f} {:>8.2f}".format(threads, single, sharded, sharded / single))
@@ -0,0 +1,119 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+An asyncio front-end to the Memory class. Rather than failing when the heap cannot meet a request, AsyncMemory.alloc
+waits (without blocking the event loop) until enough memory has been released, so clients running in an event loop need
+no retry loops of their own.
+
+Waiting requests are served strictly in the order in which they arrived: a request that cannot yet be met holds up
+every request behind it, so large requests are never starved by a stream of small ones. Each time memory is released the
+requests at the head of the queue are submitted to the memory one at a time, stopping at the first that cannot be met, so
+no memory is ever allocated on behalf of a request that has to wait. The queue is bounded; once it is full, further
+requests fail at once with asyncio.QueueFull rather than piling up.
+
+The front-end can only see free memory that the memory itself can find, so it is best used with a memory created with
+coalesce=True or auto_defrag=True; otherwise call AsyncMemory.defrag from time to time.
+"""
+
+import asyncio
+from collections import deque
+
+
+class AsyncMemory:
+    """ Manages a Memory instance on behalf of the coroutines running in an event loop. Not thread-safe: every method
+    must be called from the event loop's thread. """
+
+    def __init__(self, memory, max_waiters=64):
+        """ Creates a front-end to `memory`.
+
+        :param memory: the Memory instance to manage.
+        :param max_waiters: the largest number of alloc requests that may be waiting for memory at any one time.
+        """
+        self._memory = memory
+        self._max_waiters = max_waiters
+        self._waiters = deque()  # (size, future) pairs, in order of arrival
+
+    @property
+    def memory(self):
+        """ The Memory instance behind the front-end. """
+        return self._memory
+
+    @property
+    def waiting(self):
+        """ The number of alloc requests currently waiting for memory. """
+        return len(self._waiters)
+
+    async def alloc(self, size, timeout=None):
+        """ Allocates `size` registers, waiting for memory to be released if the request cannot be met straight away.
+
+        :param size: the size of the memory block required by the client.
+        :param timeout: the longest time to wait, in seconds (None waits for as long as it takes).
+        :return: a pointer to the first register in the allocated memory.
+        :raises asyncio.QueueFull: if max_waiters requests are already waiting.
+        :raises asyncio.TimeoutError: if the request could not be met within `timeout` seconds.
+        """
+        if not self._waiters:
+            ptr = self._memory.alloc(size)
+            if ptr is not None:
+                return ptr
+        if len(self._waiters) >= self._max_waiters:
+            raise asyncio.QueueFull("{} alloc requests are already waiting".format(len(self._waiters)))
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, future))
+        try:
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            self._withdraw(future)
+            raise
+        if not done:
+            self._withdraw(future)
+            raise asyncio.TimeoutError("no memory for a request of {} registers within {}s".format(size, timeout))
+        return future.result()
+
+    def _withdraw(self, future):
+        """ Takes a request that is no longer wanted off the queue; if it has been met in the meantime, the memory is
+        released again. """
+        if future.done():
+            self.deAlloc(future.result())
+            return
+        future.cancel()
+        self._serve()  # The withdrawn request may have been holding up the requests behind it
+
+    def deAlloc(self, addr):
+        """ Releases a block of previously allocated memory (see Memory.deAlloc), and serves any waiting requests that
+        can now be met. """
+        self._memory.deAlloc(addr)
+        self._serve()
+
+    def dealloc_many(self, addrs):
+        """ Releases a batch of previously allocated blocks (see Memory.dealloc_many), and serves any waiting requests
+        that can now be met. """
+        self._memory.dealloc_many(addrs)
+        self._serve()
+
+    def defrag(self):
+        """ Defragments the memory (see Memory.defrag), and serves any waiting requests that can now be met. """
+        self._memory.defrag()
+        self._serve()
+
+    def _serve(self):
+        """ Serves waiting requests, in order of arrival, until one cannot be met.
+
+        Requests are submitted one at a time rather than as a batch (see Memory.alloc_many): a batch would go on to
+        allocate memory for the requests behind one that fails, only for that memory to be released again, splitting
+        free segments for nothing and filling the log with calls that no client made.
+        """
+        while True:
+            self._waiters = deque(waiter for waiter in self._waiters if not waiter[1].done())  # Drop withdrawn requests
+            if not self._waiters:
+                return
+
+            (size, future) = self._waiters[0]
+            ptr = self._memory.alloc(size)
+            if ptr is None:
+                return
+            self._waiters.popleft()
+            future.set_result(ptr)
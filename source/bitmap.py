@@ -0,0 +1,94 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+A compact set of register addresses, stored as a bitmap of 64-bit words. Memory uses two of them: one marking the start
+of every allocated segment, and one marking the start of every free segment. Besides constant-time membership tests, a
+bitmap can find the next address in the set at or beyond a given address a whole word (64 registers) at a time, which
+lets a walk along the heap leap over long runs of segments it has no interest in.
+
+Only words holding at least one set bit are stored, so a bitmap's size follows the number of segments rather than the
+size of the chip; this keeps Memory cheap to create over a very large (paged) chip.
+"""
+
+from bisect import bisect_left
+
+WORD = 64
+
+
+class Bitmap:
+    """ A set of non-negative integers (addresses), held as a sparse bitmap. Iteration yields the addresses in ascending
+    order. """
+
+    __slots__ = ("_words", "_count", "_index")
+
+    def __init__(self, addresses=()):
+        self._words = {}  # Word number -> word (never 0)
+        self._count = 0
+        self._index = None  # The word numbers in ascending order, or None until next_set needs them
+        for address in addresses:
+            self.add(address)
+
+    def add(self, address):
+        """ Adds `address` to the set (if it is not there already). """
+        index, bit = divmod(address, WORD)
+        word = self._words.get(index, 0)
+        if not word >> bit & 1:
+            if not word:
+                self._index = None
+            self._words[index] = word | 1 << bit
+            self._count += 1
+
+    def remove(self, address):
+        """ Removes `address` from the set, raising KeyError if it is not there. """
+        index, bit = divmod(address, WORD)
+        word = self._words.get(index, 0)
+        if not word >> bit & 1:
+            raise KeyError(address)
+        word ^= 1 << bit
+        if word:
+            self._words[index] = word
+        else:
+            del self._words[index]
+            self._index = None
+        self._count -= 1
+
+    def __contains__(self, address):
+        return self._words.get(address // WORD, 0) >> (address % WORD) & 1 == 1
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in sorted(self._words):
+            word = self._words[index]
+            while word:
+                low = word & -word
+                yield index * WORD + low.bit_length() - 1
+                word ^= low
+
+    def next_set(self, start, stop):
+        """ Returns the smallest address in the set that is at least `start` and less than `stop`, or None.
+
+        Words are examined in turn from the one holding `start`; should more words lie ahead than the bitmap holds in
+        total, the search jumps straight to the next word holding any addresses at all, found by a binary search of the
+        word numbers. The sorted word numbers are kept from one call to the next until a word is added or emptied.
+        """
+        index, bit = divmod(start, WORD)
+        word = self._words.get(index, 0) >> bit << bit
+        while True:
+            if word:
+                address = index * WORD + (word & -word).bit_length() - 1
+                return address if address < stop else None
+            index += 1
+            if index * WORD >= stop:
+                return None
+            if (stop - 1) // WORD - index > len(self._words):
+                if self._index is None:
+                    self._index = sorted(self._words)
+                position = bisect_left(self._index, index)
+                if position == len(self._index):
+                    return None
+                index = self._index[position]
+            word = self._words.get(index, 0)
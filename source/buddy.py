@@ -0,0 +1,163 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+A binary buddy-system allocator built on the Memory class. The heap is divided into blocks whose sizes are powers of two;
+a request is serviced by the smallest block that can hold it, halving larger blocks as often as necessary, and a block
+that is released is merged with its 'buddy' (the other half of the block it was split from) for as long as the buddy is
+free too. Both alloc and deAlloc therefore take time proportional to log(heap size), and the heap never needs to be
+defragmented.
+
+Blocks use the same two-register header as every other segment (the 'next' pointer or -100, then the total size), so
+status_report, needs_repairs and friends work unchanged.
+"""
+
+from .memory import CompactionReport, Memory
+from .policies import AllocationPolicy
+from .store import TICK, CROSS
+
+MIN_ORDER = 2  # The smallest block holds 2 ** MIN_ORDER registers: two book-keeping registers and two data-registers
+
+
+class BuddyIndex(AllocationPolicy):
+    """ Keeps one free list per block size (order). A request is serviced from the smallest order whose blocks are large
+    enough, or failing that from the smallest larger order that has a free block. """
+
+    name = "buddy"
+
+    def reset(self):
+        self._orders = [{} for _ in range(64)]
+        for seg_base in self._memory._free_list:
+            self.inserted(seg_base)
+
+    def inserted(self, seg_base):
+        self._orders[self._memory._ram[seg_base + 1].bit_length() - 1][seg_base] = None
+
+    def removed(self, seg_base):
+        del self._orders[self._memory._ram[seg_base + 1].bit_length() - 1][seg_base]
+
+    def resized(self, seg_base, old_size):
+        del self._orders[old_size.bit_length() - 1][seg_base]
+        self.inserted(seg_base)
+
+    def find(self, size):
+        for segments in self._orders[order_of(size):]:
+            self._memory._walked += 1
+            if segments:
+                return next(iter(segments))
+        return None
+
+
+def order_of(size):
+    """ Returns the order of the smallest block that can service a request for `size` registers. """
+    return max(MIN_ORDER, (size + 1).bit_length())
+
+
+class BuddyMemory(Memory):
+    """ A Memory that allocates power-of-two blocks with the buddy system.
+
+    The public interface is that of Memory. Allocated segments are rounded up to a power of two (book-keeping registers
+    included), so a request for `size` registers receives a segment with at least `size` data-registers. Released
+    blocks are merged with their buddies straight away, so defrag has nothing left to do.
+    """
+
+    def __init__(self, size, heap_ptr, store="list", log_capacity=None, markers=True, deep_verify_every=None,
+                 heap_end=None, free=None):
+        """ Creates an object that manages a RAM unit `size` registers large with the buddy system.
+
+        The heap is laid out as a row of blocks, largest first, whose sizes are the powers of two that make up its size
+        (a heap of 56 registers starts out as blocks of 32, 16 and 8 registers). As every block is at least
+        2 ** MIN_ORDER registers long, the heap is shortened to a multiple of that size: up to three registers at the end
+        of the chip may be left unused.
+
+        See Memory for the meaning of the parameters. Allocation policies, coalesce and auto_defrag do not apply.
+        """
+        heap_end = size if heap_end is None else heap_end
+        heap_end -= (heap_end - heap_ptr) % 2 ** MIN_ORDER
+        if heap_end <= heap_ptr:
+            raise ValueError("the heap is too small for a buddy allocator")
+
+        super().__init__(size, heap_ptr, store=store, policy=BuddyIndex(), log_capacity=log_capacity, markers=markers,
+                         deep_verify_every=deep_verify_every, heap_end=heap_end, free=free)
+
+        if free is None:
+            # Replace the single segment laid out by Memory with the initial row of blocks
+            self._unlink_free(heap_ptr)
+            blocks = []
+            location = heap_ptr
+            for order in reversed(range(0, (heap_end - heap_ptr).bit_length())):
+                if (heap_end - heap_ptr) >> order & 1:
+                    blocks.append((location, 2 ** order))
+                    location += 2 ** order
+            for (seg_base, block_size) in reversed(blocks):
+                self._ram[seg_base + 1] = block_size
+                self._push_free(seg_base)
+                self._mark(seg_base + 2, seg_base + block_size, TICK)
+
+    def _place(self, seg_base, size):
+        """ Allocates the block at `seg_base` to a request for `size` registers, first halving it for as long as half
+        of it is big enough, and returning each unused upper half to the free list.
+
+        :return: a pointer to the first register in the allocated memory.
+        """
+        self._unlink_free(seg_base)
+        block_size = self._ram[seg_base + 1]
+        wanted = 2 ** order_of(size)
+        if block_size > wanted:
+            self._splits += 1
+        else:
+            self._whole += 1
+        while block_size > wanted:
+            block_size //= 2
+            self._ram[seg_base + block_size + 1] = block_size
+            self._push_free(seg_base + block_size)
+        self._ram[seg_base] = -100
+        self._ram[seg_base + 1] = block_size
+        self._mark_segment(seg_base, CROSS)
+        self._allocated.add(seg_base)
+        self._allocated_registers += block_size
+        self._last_touched = seg_base
+        return seg_base + 2
+
+    def _release(self, seg_base):
+        """ Returns the allocated block at `seg_base` to the free list, merging it with its buddy, the merged block with
+        its own buddy, and so on for as long as the buddies are free. """
+        self._invalidate(seg_base)
+        block_size = self._ram[seg_base + 1]
+        self._allocated.remove(seg_base)
+        self._allocated_registers -= block_size
+        self._mark_segment(seg_base, TICK)
+
+        while True:
+            buddy = self._heap_ptr + ((seg_base - self._heap_ptr) ^ block_size)
+            if buddy not in self._back or self._ram[buddy + 1] != block_size:
+                break
+            self._unlink_free(buddy)
+            upper = max(seg_base, buddy)
+            self._mark(upper, upper + 2, TICK)
+            seg_base = min(seg_base, buddy)
+            block_size *= 2
+
+        self._ram[seg_base + 1] = block_size
+        self._push_free(seg_base)
+        self._last_touched = seg_base
+
+    def _resize_in_place(self, seg_base, new_size):
+        """ A block can only be resized in place if the new size calls for a block of the same size (see
+        Memory.realloc). """
+        return 2 ** order_of(new_size) == self._ram[seg_base + 1]
+
+    def defrag(self):
+        """ Does nothing: free buddies are always merged as soon as the second of them is released. """
+
+    def defrag_step(self, budget=Memory.DEFRAG_BUDGET):
+        """ Does nothing (see defrag). """
+        return True
+
+    def compact(self):
+        """ Does nothing: blocks cannot be moved without breaking up the pairs of buddies (see defrag).
+
+        :return: a CompactionReport in which no segments have been moved (see Memory.compact).
+        """
+        return CompactionReport(0, 0, len(self._back), 0.0)
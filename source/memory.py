@@ -5,22 +5,40 @@ __author__ = 'paulpatterson'
 
 """
 The following class has been created to explor memory allocation algorithms, notably: first-fit, best-fit,
-and defrag (only the first of these is currently implemented). It was inspired by a lecture presented in Schocken and
+and defrag (see policies.py for the full set of allocation policies). It was inspired by a lecture presented in Schocken and
 Nissan's Nand2Tetris course (see 'The Elements of a Computing System - Building a Computer From First Principles'). The
 class is best used in conjuction with the associated testing file (test_memory.py), which allows you to put your
 algorithm implmentations to the test.
 """
 
-from collections import namedtuple
+from array import array
+from bisect import bisect_left, insort
+from collections import namedtuple, deque
 from pathlib import Path
+import mmap
 import os.path
+import struct
+import time
+
+from .bitmap import Bitmap
+from .policies import FirstFit, make_policy
+from .store import TICK, CROSS, NONE_CODE, ArrayStore, codes, decode, encode, fill, make_store
+from .view import SegmentView
 
 Alloc = namedtuple("Alloc", "size addr")
 Dealloc = namedtuple("Dealloc", "addr")
 RepairsChecklist = namedtuple("RepairsChecklist", "malformed_segments bad_register_count malformed_freelist")
-
-TICK = "✔"
-CROSS = "✗"
+CompactionReport = namedtuple("CompactionReport", "segments_moved registers_moved free_segments seconds")
+Metrics = namedtuple("Metrics", "free_segments free_registers largest_free fragmentation allocs splits whole_segments "
+                                "failures walked_per_alloc deallocs defrag_seconds")
+
+# Snapshot files (see Memory.save) start with a header of SNAPSHOT_HEADER.size bytes: a magic number, the format version,
+# the size of the chip, its heap pointer, the end of its heap, the head of its free list, the number of calls logged, the
+# capacity of the log (-1 for unlimited, 0 for off) and the number of log entries saved. The registers follow, eight
+# bytes each, and the log entries after them, sixteen bytes each.
+SNAPSHOT_MAGIC = b"RAMCHIP\0"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8s8q")
 
 class Memory:
     """ This class is a crude simulation of an OS-level object charged with managing a RAM chip. Once
@@ -29,7 +47,11 @@ class Memory:
     that has been reserved for the caller; the latter returns previosuly reserved memory to the pool of 'free'
     memory, ready for resuse. """
 
-    def __init__(self, size, heap_ptr):
+    DEFRAG_BUDGET = 64  # The default number of segments visited by each call to defrag_step
+    REPORT_CHUNK = 4096  # The number of registers rendered at a time by the report generators
+
+    def __init__(self, size, heap_ptr, store="list", policy="first-fit", coalesce=False, auto_defrag=False,
+                 log_capacity=None, markers=True, deep_verify_every=None, heap_end=None, free=None):
         """ Creates an object that manages a RAM unit `size` registers large.
 
         'Under the hood' the ram chip is modelled as a list, where len(list) == `size`. Each item in the list represents
@@ -38,86 +60,511 @@ class Memory:
         implementation. That is, 'ram', 'address', 'register contents', etc are preferred over 'list', 'list index',
         'list value', etc
 
+        For very large chips the list can be swapped for a compact typed store (see store.py), which holds each register
+        in eight bytes, or for a paged store, which only allocates space for the parts of the chip that have been
+        written to, so that even a huge chip is created almost instantly. The choice of store is invisible to the rest
+        of the class, and to its clients.
+
         :param size: the total size of the ram chip managed by this object.
         :param heap_ptr: an address specifying the point on the ram chip at which the heap starts. All addresses below
         this value are considered to be stack addresses.
+        :param store: the kind of register store used to model the ram chip: 'list' (the default), 'array' or 'paged'. An
+        existing store `size` registers long may also be passed, in which case its contents from `heap_ptr` up to
+        `heap_end` are overwritten and managed by this object.
+        :param policy: the allocation policy used by alloc: the name of one of the policies in policies.py (first-fit
+        by default), or an AllocationPolicy instance.
+        :param coalesce: if True, deAlloc immediately merges the released segment with any free segments that sit
+        either side of it on the chip, so that the heap never needs to be defragmented.
+        :param auto_defrag: if True, an alloc request that cannot be met triggers incremental defragmentation (see
+        defrag_step), which runs only until a large enough segment has been formed.
+        :param log_capacity: the number of alloc and deAlloc calls remembered by the log. None (the default) remembers
+        every call; a positive number keeps only the most recent calls; 0 turns logging off altogether.
+        :param markers: if False, the data-registers of a segment are left untouched when it is allocated or released,
+        rather than being filled with TICK or CROSS markers. Reports are less readable, but segments of any size can be
+        allocated and released in constant time.
+        :param deep_verify_every: if set, every Nth call to needs_repairs(fast=True) performs the full set of checks
+        rather than the constant-time ones (see needs_repairs).
+        :param heap_end: the address just beyond the last register of the heap (by default, the end of the chip). The
+        registers from `heap_end` onwards are left alone; this allows several Memory objects to manage neighbouring
+        parts of a single chip.
+        :param free: only used when `store` is an existing store whose heap has already been laid out (by another
+        Memory object, for instance). In that case `free` is the address of the first segment in the heap's free list,
+        and the heap is adopted as it is rather than being wiped.
         """
-        self._ram = [None for i in range(0, size)]
-
-        self._ram[heap_ptr] = -1
-        self._ram[heap_ptr + 1] = len(self._ram) - heap_ptr
-
+        self._ram = make_store(store, size) if isinstance(store, str) else store
+        self._heap_end = len(self._ram) if heap_end is None else heap_end
         self._heap_ptr = heap_ptr
-        self._free = heap_ptr
-        self._write_segment(self._free, "✔")
-        self._log = []
+
+        self._deep_verify_every = deep_verify_every
+        self._fast_checks = 0
+        self._coalesce = coalesce
+        self._auto_defrag = auto_defrag
+        self._markers = markers
+        self._log = deque(maxlen=log_capacity) if log_capacity != 0 else None
+        self._log_count = 0  # The number of calls logged, including any that have since dropped out of the log
+        self._policy = make_policy(policy)
+        self._hooks = []
+        self._handles = {}      # Handle -> base address of the (movable) segment it refers to
+        self._handle_of = {}    # Base address of a movable segment -> its handle
+        self._next_handle = 1
+        self._epochs = {}       # Base address of a segment that has been viewed -> the number of times it has changed
+
+        # Running totals reported by metrics
+        self._splits = 0        # Allocations met by splitting a segment
+        self._whole = 0         # Allocations met with a whole segment
+        self._failures = 0
+        self._walked = 0        # Free segments examined by the allocation policy
+        self._deallocs = 0
+        self._defrag_ns = 0
+
+        if free is None:
+            self._ram[heap_ptr] = -1
+            self._ram[heap_ptr + 1] = self._heap_end - heap_ptr
+            self._mark_segment(heap_ptr, TICK)
+            free = heap_ptr
+        self._free = free
+        self._reindex()
+
+    def _reindex(self):
+        """ Rebuilds every table and counter that the memory keeps alongside the chip from the contents of the chip
+        itself (and the head of the free list, self._free).
+
+        This is only necessary when the chip has been modified behind the memory's back - by another process sharing
+        the chip, say, or when a chip is loaded from a snapshot. It takes time proportional to the number of segments in
+        the heap.
+        """
+        self._allocated = Bitmap()      # Base addresses of all allocated segments
+        self._allocated_registers = 0
+        location = self._heap_ptr
+        while location < self._heap_end:
+            seg_size = self._ram[location + 1]
+            if self._ram[location] == -100:
+                self._allocated.add(location)
+                self._allocated_registers += seg_size
+            location += seg_size
+
+        self._back = {}
+        self._ends = {}
+        self._free_starts = Bitmap()    # Base addresses of all free segments
+        self._free_sizes = {}           # The number of free segments of each size
+        self._sizes = []                # The distinct sizes of the free segments, in ascending order
+        self._free_registers = 0
+        previous = -1
+        for seg_base in self._iter_free():
+            seg_size = self._ram[seg_base + 1]
+            self._back[seg_base] = previous
+            self._ends[seg_base + seg_size] = seg_base
+            self._free_starts.add(seg_base)
+            self._count_free_size(seg_size, 1)
+            self._free_registers += seg_size
+            previous = seg_base
+
+        self._last_touched = self._heap_ptr   # The most recently allocated or released segment
+        self._defrag_cursor = self._heap_ptr
+        self._policy.attach(self)
+
+    def save(self, path):
+        """ Writes a binary snapshot of the memory - the contents of the RAM chip, the layout of the heap and the log - to
+        a file, from which it can be restored with Memory.load.
+
+        Registers are saved as they would be held by an 'array' store, so a snapshot can only be taken if every register
+        holds None, TICK, CROSS or an integer that fits in a signed 64-bit register (the three lowest such integers are
+        reserved). The snapshot is written to a temporary file (`path` with '.partial' appended) that only replaces `path`
+        once it is complete, so a snapshot that cannot be taken leaves any existing file at `path` untouched.
+
+        :param path: a Path object referencing the file to be written.
+        :raises TypeError, ValueError, OverflowError: if a register holds a value that cannot be saved (see encode).
+        """
+        size = len(self._ram)
+        log = self._log if self._log is not None else ()
+        capacity = 0 if self._log is None else -1 if self._log.maxlen is None else self._log.maxlen
+        temporary = path.as_posix() + ".partial"
+        try:
+            with open(temporary, "wb") as snapshot:
+                snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, size, self._heap_ptr,
+                                                    self._heap_end, self._free, self._log_count, capacity, len(log)))
+                for start in range(0, size, 16 * self.REPORT_CHUNK):
+                    codes(self._ram, start, min(size, start + 16 * self.REPORT_CHUNK)).tofile(snapshot)
+                entries = array("q")
+                for entry in log:
+                    entries.extend((NONE_CODE, entry.addr) if len(entry) == 1 else (entry.size, encode(entry.addr)))
+                entries.tofile(snapshot)
+            os.replace(temporary, path.as_posix())
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path, **options):
+        """ Restores a memory from a snapshot written by save.
+
+        The snapshot file is mapped into memory rather than read, so the registers are never copied wholesale: data
+        registers are only read from disk when they are first used. The mapping is private, so changes made to the
+        restored memory never find their way back into the file. The restored memory always uses an 'array' store.
+
+        Loading is not free of cost, however. The tables kept alongside the chip (see _reindex) are rebuilt by walking
+        every segment in the heap, which takes time proportional to the number of segments and reads the page holding
+        each segment header. On a heavily fragmented heap that can mean reading most of the file.
+
+        :param path: a Path object referencing a snapshot file.
+        :param options: any further keyword arguments (policy, coalesce, markers and so on) are passed on to Memory,
+        as the snapshot does not record them. The log keeps the capacity it had when it was saved, unless log_capacity
+        is given.
+        :return: a new Memory instance.
+        :raises ValueError: if the file is not a complete snapshot.
+        :raises TypeError: if `store` is given (the restored memory's store is always laid over the snapshot).
+        """
+        if "store" in options:
+            raise TypeError("load() does not take a store: a restored memory always uses an 'array' store")
+        with open(path.as_posix(), "rb") as snapshot:
+            header = snapshot.read(SNAPSHOT_HEADER.size)
+            if len(header) < SNAPSHOT_HEADER.size or not header.startswith(SNAPSHOT_MAGIC):
+                raise ValueError("{} is not a memory snapshot".format(path))
+            (_, version, size, heap_ptr, heap_end, free, log_count, capacity, entries) = SNAPSHOT_HEADER.unpack(header)
+            if version != SNAPSHOT_VERSION:
+                raise ValueError("unsupported snapshot version {}".format(version))
+            chip = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(chip) != SNAPSHOT_HEADER.size + 8 * size + 16 * entries:
+            chip.close()
+            raise ValueError("{} is truncated or corrupt".format(path))
+
+        registers = memoryview(chip)[SNAPSHOT_HEADER.size: SNAPSHOT_HEADER.size + 8 * size].cast("q")
+        log = array("q", memoryview(chip)[SNAPSHOT_HEADER.size + 8 * size:].cast("q"))
+        options.setdefault("log_capacity", None if capacity == -1 else capacity)
+        memory = cls(size, heap_ptr, store=ArrayStore(buffer=registers), heap_end=heap_end, free=free, **options)
+
+        if memory._log is not None:
+            memory._log.extend(Dealloc(log[i + 1]) if log[i] == NONE_CODE else Alloc(log[i], decode(log[i + 1]))
+                               for i in range(0, 2 * entries, 2))
+            memory._log_count = log_count
+        return memory
 
     def alloc(self, size):
-        """ Uses the first-fit algorithm to find a run of unallocated memory that is at least as big as `size`.
+        """ Uses the memory's allocation policy (first-fit by default) to find a run of unallocated memory that is at
+        least as big as `size`.
 
-        This implementation of alloc walks the free_list looking for the first segment large enough to service this
-        request. If a segment is large enough, it is split in order to create a new segment. The returned pointer
-        points to a block of memory exactly `size` registers long, and the pre-existing segment is guaranteed to be no
-        smaller than 3 registers long (two book-keeping registers, one data-register). If a segment is large enough to
-        service the request, but not large enough to be split, the whole segment is effectively allocated to the client.
-        If the free_list contains no segment where either of the above is possible, the allocation request fails.
+        The policy picks a segment from the free_list that is large enough to service this request (see policies.py).
+        If the segment is large enough, it is split in order to create a new segment. The returned pointer points to a
+        block of memory exactly `size` registers long, and the pre-existing segment is guaranteed to be no smaller than 3
+        registers long (two book-keeping registers, one data-register). If a segment is large enough to service the
+        request, but not large enough to be split, the whole segment is effectively allocated to the client. If the
+        free_list contains no segment where either of the above is possible, the allocation request fails. The memory
+        keeps an index of the sizes of its free segments, so such a request fails at once, without walking the list.
 
         :param size: the size of the memory block required by the client.
         :return: a pointer to the first register in the allocated memory, or None if the request can be met.
         """
-        if self._free == -1:
-            self._log.insert(0, Alloc(size, None))
-            return None  # ram full!
+        started = time.perf_counter_ns() if self._hooks else None
+        seg_base = self._find(size)
+        ptr = None if seg_base is None else self._place(seg_base, size)
+        entry = self._failed_alloc(size) if ptr is None else Alloc(size, ptr)
+        self._record(entry)
+        if started is not None:
+            self._notify([entry], started)
+        return ptr
+
+    def alloc_many(self, sizes):
+        """ Services a batch of allocation requests, returning exactly what the equivalent sequence of alloc calls would
+        have returned.
+
+        With the first-fit policy successive searches share a single traversal of the free list wherever possible:
+        every segment passed over while servicing one request is too small for any request at least as large, so a
+        search for such a request resumes from the segment that serviced its predecessor. The whole batch is logged in
+        one go.
+
+        :param sizes: an iterable of request sizes.
+        :return: a list holding a pointer (or None) for each request, in order.
+        """
+        started = time.perf_counter_ns() if self._hooks else None
+        ptrs = []
+        entries = []
+        shared_walk = isinstance(self._policy, FirstFit)
+        resume, resume_size = self._free, 0
+
+        for size in sizes:
+            if not self._fits(size):
+                seg_base = None
+            elif shared_walk and size >= resume_size and (resume == -1 or resume in self._back):
+                seg_base = self._policy.find_from(size, resume)
+            else:
+                seg_base = self._policy.find(size)
+
+            if seg_base is None and self._auto_defrag:
+                seg_base = self._policy.find(size) if self._defrag_until_fits(size) else None
+                resume, resume_size = self._free, 0  # Defragmentation invalidates the shared walk
+
+            if seg_base is None:
+                ptrs.append(None)
+                entries.append(self._failed_alloc(size))
+                continue
+
+            nxt = self._ram[seg_base]
+            ptr = self._place(seg_base, size)
+            ptrs.append(ptr)
+            entries.append(Alloc(size, ptr))
+            resume, resume_size = (seg_base if seg_base in self._back else nxt), size
+
+        self._record_many(entries)
+        if started is not None:
+            self._notify(entries, started)
+        return ptrs
+
+    def _find(self, size):
+        """ Returns the base address of a free segment that can service a request for `size` registers, or None. """
+        seg_base = self._policy.find(size) if self._fits(size) else None
+        if seg_base is None and self._auto_defrag and self._defrag_until_fits(size):
+            seg_base = self._policy.find(size)
+        return seg_base
+
+    def _place(self, seg_base, size):
+        """ Allocates `size` registers from the free segment at `seg_base`, splitting it if it is large enough.
+
+        :return: a pointer to the first register in the allocated memory.
+        """
+        total_segment_size = self._ram[seg_base + 1]
+        if size < (total_segment_size - 4):
+            # Split the segment, and return the 'second half' of the split
+            self._resize_free(seg_base, total_segment_size - 2 - size)
+            new_seg_base = seg_base + total_segment_size - 2 - size
+            self._ram[new_seg_base] = -100
+            self._ram[new_seg_base + 1] = size + 2
+            self._mark_segment(new_seg_base, CROSS)
+            self._allocated.add(new_seg_base)
+            self._allocated_registers += size + 2
+            self._last_touched = new_seg_base
+            self._splits += 1
+            return new_seg_base + 2
+
+        # Return the whole segment (modify the free list first)
+        self._unlink_free(seg_base)
+        self._ram[seg_base] = -100
+        self._mark_segment(seg_base, CROSS)
+        self._allocated.add(seg_base)
+        self._allocated_registers += total_segment_size
+        self._last_touched = seg_base
+        self._whole += 1
+        return seg_base + 2
+
+    def _failed_alloc(self, size):
+        """ The log entry for a request for `size` registers that could not be met. """
+        self._failures += 1
+        return Alloc(size, None if self._free == -1 else -1)
+
+    def _record(self, entry):
+        """ Appends an Alloc or Dealloc entry to the log (unless logging is turned off). """
+        if self._log is not None:
+            self._log.append(entry)
+            self._log_count += 1
+
+    def _record_many(self, entries):
+        """ Appends a list of Alloc and Dealloc entries to the log (unless logging is turned off). """
+        if self._log is not None:
+            self._log.extend(entries)
+            self._log_count += len(entries)
+
+    def _notify(self, entries, started):
+        """ Passes each of `entries` to every hook (see add_hook), along with its share of the time elapsed since
+        `started` (a time.perf_counter_ns reading). """
+        elapsed = (time.perf_counter_ns() - started) // max(1, len(entries))
+        for hook in list(self._hooks):
+            for entry in entries:
+                hook(entry, elapsed)
+
+    def add_hook(self, hook):
+        """ Registers a function to be called after every alloc and deAlloc call (including those made through
+        alloc_many and dealloc_many), so that profilers and exporters can follow the memory without patching it.
+
+        :param hook: a callable taking two arguments: the call's log entry (an Alloc or Dealloc namedtuple) and the time
+        taken by the call in nanoseconds. Hooks are called whether or not logging is turned on.
+        """
+        self._hooks.append(hook)
 
-        seg_base = self._free
-        previous_seg_base = None
+    def remove_hook(self, hook):
+        """ Unregisters a function registered with add_hook. """
+        self._hooks.remove(hook)
 
-        while True:
-            total_segment_size = self._ram[seg_base + 1]
-
-            if size < (total_segment_size - 4):
-                # Split the segment, and return the 'second half' of the split
-                self._ram[seg_base + 1] = total_segment_size - 2 - size
-                new_seg_base = seg_base + total_segment_size - 2 - size
-                self._ram[new_seg_base] = -100
-                self._ram[new_seg_base + 1] = size + 2
-                self._write_segment(new_seg_base, CROSS)
-                self._log.insert(0, Alloc(size, new_seg_base + 2))
-                return new_seg_base + 2
-
-            if size < (total_segment_size - 1):
-                # Return the whole segment (modify the free list first)
-                if seg_base == self._free:
-                    # Removing first link
-                    self._free = self._ram[self._free]
-                elif self._ram[seg_base] == -1:
-                    # Removing last link
-                    self._ram[previous_seg_base] = -1
-                else:
-                    # Removing middle link
-                    self._ram[previous_seg_base] = self._ram[seg_base]
-
-                self._ram[seg_base] = -100
-                self._write_segment(seg_base, CROSS)
-                self._log.insert(0, Alloc(size, seg_base + 2))
-                return seg_base + 2
-
-            if self._ram[seg_base] == -1:
-                self._log.insert(0, Alloc(size, -1))
-                return
-            else:
-                previous_seg_base = seg_base
-                seg_base = self._ram[seg_base]
+    def realloc(self, addr, new_size):
+        """ Changes the size of a block of previously allocated memory, keeping its contents (or as much of them as will
+        fit in the new size).
+
+        The block is resized where it stands whenever possible: a shrinking block gives up the registers at its end
+        (which are released, exactly as if they had been a segment passed to deAlloc), and a growing block takes what it
+        needs from the segment that immediately follows it on the chip, provided that segment is free and large enough.
+        Otherwise a new block is allocated, the contents are copied across, and the old block is released; both of these
+        calls are logged as usual. If no block large enough can be found, the original block is left untouched.
+
+        :param addr: A memory address pointing to the start of a segment of previously allocated memory.
+        :param new_size: the number of registers required.
+        :return: a tuple (addr, copied), where `addr` points to the resized block (or is None if the request could not
+        be met), and `copied` is True if the contents had to be moved to a new block.
+        """
+        self._check_allocated(addr)
+        seg_base = addr - 2
+        if self._resize_in_place(seg_base, new_size):
+            self._last_touched = seg_base
+            return addr, False
+
+        new_addr = self.alloc(new_size)
+        if new_addr is None:
+            return None, False
+        kept = min(new_size, self._ram[seg_base + 1] - 2)
+        self._ram[new_addr: new_addr + kept] = self._ram[addr: addr + kept]
+        handle = self._handle_of.pop(seg_base, None)
+        if handle is not None:
+            self._handles[handle] = new_addr - 2
+            self._handle_of[new_addr - 2] = handle
+        self.deAlloc(addr)
+        return new_addr, True
+
+    def _resize_in_place(self, seg_base, new_size):
+        """ Resizes the allocated segment at `seg_base` to hold `new_size` registers without moving it, if possible (see
+        realloc).
+
+        :return: True if the segment now holds at least `new_size` registers.
+        """
+        seg_size = self._ram[seg_base + 1]
+        needed = new_size + 2
+        if needed <= seg_size:
+            if seg_size - needed >= 3:
+                # Split off the tail as an allocated segment of its own, and release it
+                self._invalidate(seg_base)
+                tail = seg_base + needed
+                self._ram[seg_base + 1] = needed
+                self._ram[tail] = -100
+                self._ram[tail + 1] = seg_size - needed
+                self._allocated.add(tail)
+                self._release(tail)
+            return True
+
+        follower = seg_base + seg_size
+        if follower not in self._back or seg_size + self._ram[follower + 1] < needed:
+            return False
+        combined = seg_size + self._ram[follower + 1]
+        self._invalidate(seg_base)
+        self._unlink_free(follower)
+        if combined - needed >= 3:
+            remainder = seg_base + needed
+            self._ram[remainder + 1] = combined - needed
+            self._push_free(remainder)
+        else:
+            needed = combined
+        self._ram[seg_base + 1] = needed
+        self._mark(follower, seg_base + needed, CROSS)
+        self._allocated_registers += needed - seg_size
+        if seg_base < self._defrag_cursor < seg_base + combined:
+            self._defrag_cursor = seg_base
+        return True
+
+    def view(self, addr):
+        """ Returns a SegmentView of a block of allocated memory: a window through which its registers can be read and
+        written in place, without copying them (see view.py). The view goes stale if the block is released, resized or
+        moved.
+
+        :param addr: A memory address pointing to the start of a segment of previously allocated memory.
+        """
+        self._check_allocated(addr)
+        return SegmentView(self, addr - 2)
+
+    def _invalidate(self, seg_base):
+        """ Makes any views of the segment at `seg_base` stale (called when the segment is released, resized or
+        moved). """
+        if seg_base in self._epochs:
+            self._epochs[seg_base] += 1
 
     def deAlloc(self, addr):
         """ Releases a block of previously allocated memory.
 
+        If the memory was created with coalesce=True the released segment is merged with its free neighbours (if
+        any); otherwise it is simply pushed onto the head of the free list.
+
         :param addr: A memory address pointing to the start of a segment of previously allocated memory.
+        :raises ValueError: if `addr` does not point to allocated memory (it is bogus, or has already been released), or
+        the memory was allocated through a handle (see free_handle).
+        """
+        started = time.perf_counter_ns() if self._hooks else None
+        self._check_releasable(addr)
+        self._release(addr - 2)
+        self._deallocs += 1
+        self._record(Dealloc(addr))
+        if started is not None:
+            self._notify([Dealloc(addr)], started)
+
+    def dealloc_many(self, addrs):
+        """ Releases a batch of previously allocated blocks, exactly as the equivalent sequence of deAlloc calls would,
+        and logs the whole batch in one go.
+
+        :param addrs: an iterable of memory addresses, each pointing to the start of a block of allocated memory.
+        :raises ValueError: if an address does not point to allocated memory, or the memory was allocated through a
+        handle. The blocks before it in the batch are released (and logged) nonetheless.
+        """
+        started = time.perf_counter_ns() if self._hooks else None
+        entries = []
+        try:
+            for addr in addrs:
+                self._check_releasable(addr)
+                self._release(addr - 2)
+                entries.append(Dealloc(addr))
+        finally:
+            self._deallocs += len(entries)
+            self._record_many(entries)
+            if started is not None:
+                self._notify(entries, started)
+
+    def _check_allocated(self, addr):
+        """ Raises ValueError unless `addr` points to the first data-register of an allocated segment. Takes constant
+        time, thanks to the bitmap of allocated segments. """
+        if addr - 2 not in self._allocated:
+            raise ValueError("{} does not point to allocated memory".format(addr))
+
+    def _check_releasable(self, addr):
+        """ Raises ValueError unless `addr` points to allocated memory that may be passed to deAlloc: memory allocated
+        through a handle must be released with free_handle, so that compact can never mistake another segment later
+        allocated at the same address for it. """
+        self._check_allocated(addr)
+        if addr - 2 in self._handle_of:
+            raise ValueError("{} was allocated through a handle; release it with free_handle".format(addr))
+
+    def _release(self, seg_base):
+        """ Returns the allocated segment at `seg_base` to the free list. """
+        self._invalidate(seg_base)
+        self._allocated.remove(seg_base)
+        self._allocated_registers -= self._ram[seg_base + 1]
+        self._last_touched = seg_base
+        if self._coalesce:
+            self._release_coalescing(seg_base)
+        else:
+            self._push_free(seg_base)
+            self._mark_segment(seg_base, TICK)
+
+    def _release_coalescing(self, seg_base):
+        """ Returns the allocated segment at `seg_base` to the free list, merging it with the free segments (if any)
+        that immediately precede and follow it on the chip.
+
+        Both neighbours are found in constant time: the following segment starts where this one ends, and the preceding
+        free segment (if there is one) is recorded in self._ends against the address at which it ends.
+
+        :param seg_base: an address pointing to the start of an allocated memory segment.
         """
-        self._ram[addr - 2] = self._free
-        self._free = addr - 2
-        self._write_segment(self._free, TICK)
-        self._log.insert(0, Dealloc(addr))
+        size = self._ram[seg_base + 1]
+        follower = seg_base + size
+        if follower in self._back:
+            self._unlink_free(follower)
+            size += self._ram[follower + 1]
+
+        predecessor = self._ends.get(seg_base)
+        if predecessor is None:
+            self._ram[seg_base + 1] = size
+            self._push_free(seg_base)
+            self._mark_segment(seg_base, TICK)
+        else:
+            self._mark(seg_base, seg_base + size, TICK)
+            self._resize_free(predecessor, self._ram[predecessor + 1] + size)
+            seg_base = predecessor
+            size = self._ram[predecessor + 1]
+
+        if seg_base < self._defrag_cursor < seg_base + size:
+            self._defrag_cursor = seg_base
 
     def defrag(self):
         """ Combines contiguous 'free' segments of memory, resulting in reduced RAM fragmentation.
@@ -126,31 +573,305 @@ class Memory:
         as it encounters them, and updating the free-list accordingly. It's probably the slowest and simplest of
         the available algorithms, but it has the advantage that even in the worst case it uses very little RAM.
 
+        Runs of allocated segments are not walked: the free segments are visited in address order, straight from the
+        bitmap of free segment starts, so each run of free segments is reached without reading the headers in between.
+
         Note that defrag is never called internally; if a client objects wants defragmentation (perhaps because a call
-        to alloc has returned None), that object must call this method itself.
+        to alloc has returned None), that object must call this method itself. Clients that cannot afford to pause for
+        the whole heap can use defrag_step instead, or create the memory with auto_defrag=True.
         """
+        started = time.perf_counter_ns()
+        self._defrag_cursor = self._heap_ptr
         location = self._heap_ptr
-        self._free = -1
-        previous_block_start = None
-        while location < len(self._ram):
-            if self._ram[location] != -100:
-                block_start = location
-                self._ram[block_start] = -1
-                block_width = self._ram[location + 1]
-                location += block_width
-                while location < len(self._ram) and self._ram[location] != -100:
-                    segment_width = self._ram[location + 1]
-                    block_width += segment_width
-                    self._ram[location:location+2] = ["✔", "✔"]
-                    location += segment_width
-                self._ram[block_start + 1] = block_width
-
-                if self._free == -1:
-                    self._free = block_start
-                else:
-                    self._ram[previous_block_start] = block_start
-                previous_block_start = block_start
-            location = location + self._ram[location + 1] if location < len(self._ram) else location
+        blocks = []
+        for block_start in self._free_starts:
+            if block_start < location:
+                continue  # Already merged into the run before it
+            self._ram[block_start] = -1
+            block_width = self._ram[block_start + 1]
+            location = block_start + block_width
+            while location < self._heap_end and self._ram[location] != -100:
+                segment_width = self._ram[location + 1]
+                block_width += segment_width
+                self._mark(location, location + 2, TICK)
+                location += segment_width
+            self._ram[block_start + 1] = block_width
+
+            if blocks:
+                self._ram[blocks[-1][0]] = block_start
+            blocks.append((block_start, block_width))
+
+        self._index_free(blocks)
+        self._defrag_ns += time.perf_counter_ns() - started
+
+    def _index_free(self, blocks):
+        """ Rebuilds the free list tables after the whole heap has been defragmented.
+
+        :param blocks: a (start, width) tuple for each free segment on the chip, in ascending order of address. The
+        segments must already be linked on the chip in that order.
+        """
+        self._free = blocks[0][0] if blocks else -1
+        self._back = {}
+        self._ends = {}
+        self._free_starts = Bitmap()
+        self._free_sizes = {}
+        self._sizes = []
+        previous_block_start = -1
+        for (block_start, block_width) in blocks:
+            self._back[block_start] = previous_block_start
+            self._ends[block_start + block_width] = block_start
+            self._free_starts.add(block_start)
+            self._count_free_size(block_width, 1)
+            previous_block_start = block_start
+        self._policy.reset()
+
+    def defrag_step(self, budget=DEFRAG_BUDGET):
+        """ Performs a bounded amount of defragmentation, picking up where the previous call left off.
+
+        Each call marches along the heap from a saved cursor, merging every free segment it meets with any free
+        segments that immediately follow it, until it has visited `budget` segments or reached the end of the heap. The
+        free list is valid (and needs_repairs holds) between calls, so calls can be interleaved freely with alloc and
+        deAlloc. Unlike defrag, merged segments keep their place in the free list rather than being re-ordered.
+
+        :param budget: the maximum number of segments to visit (merged segments included).
+        :return: True if this call reached the end of the heap (the next call will start from the beginning again).
+        """
+        return self._defrag_step(budget)[0]
+
+    def _defrag_step(self, budget):
+        """ Does the work of defrag_step.
+
+        :return: a tuple (done, largest) where `done` is the return value of defrag_step, and `largest` is the total
+        size of the largest free segment visited during this call.
+        """
+        started = time.perf_counter_ns()
+        ram = self._ram
+        location = self._defrag_cursor
+        largest = 0
+        while budget > 0 and location < self._heap_end:
+            size = ram[location + 1]
+            if location in self._back:
+                follower = location + size
+                while budget > 0 and follower in self._back:
+                    self._unlink_free(follower)
+                    size += ram[follower + 1]
+                    self._mark(follower, follower + 2, TICK)
+                    self._resize_free(location, size)
+                    follower = location + size
+                    budget -= 1
+                largest = max(largest, size)
+                if follower in self._back:
+                    break  # Out of budget part way through a run of free segments; resume from here next time
+            location += size
+            budget -= 1
+
+        done = location >= self._heap_end
+        self._defrag_cursor = self._heap_ptr if done else location
+        self._defrag_ns += time.perf_counter_ns() - started
+        return done, largest
+
+    def _defrag_until_fits(self, size):
+        """ Calls _defrag_step until it forms a segment that can service a request for `size` registers, or until it
+        has covered the whole heap.
+
+        :return: True if a large enough segment was found.
+        """
+        if self._free_registers < size + 2:
+            return False  # Not even a fully defragmented heap could meet the request
+        start = self._defrag_cursor
+        wrapped = False
+        while True:
+            done, largest = self._defrag_step(self.DEFRAG_BUDGET)
+            if largest >= size + 2:
+                return True
+            if done:
+                if wrapped:
+                    return False  # The end of the heap has been reached twice: every segment has been visited
+                wrapped = True
+            if wrapped and self._defrag_cursor >= start:
+                return False
+
+    def alloc_handle(self, size):
+        """ Allocates `size` registers, exactly as alloc does, but returns a handle rather than a pointer.
+
+        Memory allocated through a handle may be moved by compact; its current address is always available from
+        address(handle). Memory allocated with alloc is never moved.
+
+        :param size: the size of the memory block required by the client.
+        :return: a handle (a positive integer), or None if the request cannot be met.
+        """
+        ptr = self.alloc(size)
+        if ptr is None:
+            return None
+        handle = self._next_handle
+        self._next_handle += 1
+        self._handles[handle] = ptr - 2
+        self._handle_of[ptr - 2] = handle
+        return handle
+
+    def address(self, handle):
+        """ Returns a pointer to the first register of the memory referred to by `handle` (valid until the next call to
+        compact). """
+        return self._handles[handle] + 2
+
+    def free_handle(self, handle):
+        """ Releases the memory referred to by `handle` (see deAlloc); the handle cannot be used afterwards. Memory
+        allocated through a handle must always be released this way, rather than by passing its address to deAlloc. """
+        seg_base = self._handles.pop(handle)
+        del self._handle_of[seg_base]
+        self.deAlloc(seg_base + 2)
+
+    def compact(self):
+        """ Slides every segment allocated through alloc_handle towards the start of the heap, so that the free memory
+        between them is gathered together.
+
+        Segments allocated with alloc are pinned in place, and the free memory gathered in front of each of them becomes
+        a free segment of its own. If nothing is pinned the heap ends up with a single free segment at its end. The free
+        list is rebuilt in address order, and the handles are updated to follow their segments.
+
+        :return: a CompactionReport giving the number of segments and registers moved, the number of free segments
+        left, and the time taken in seconds.
+        """
+        started = time.perf_counter_ns()
+        ram = self._ram
+        moved = registers_moved = 0
+        free_segments = []
+        handle_of = {}
+        destination = location = self._heap_ptr
+
+        def fill_gap(stop):
+            # Turns the registers from `destination` up to `stop` into a free segment. The gap is made up of the free
+            # segments passed over since the last pinned segment, so it is never too small to be a segment itself.
+            if stop > destination:
+                ram[destination + 1] = stop - destination
+                self._mark_segment(destination, TICK)
+                free_segments.append(destination)
+
+        while location < self._heap_end:
+            seg_size = ram[location + 1]
+            if ram[location] == -100:
+                handle = self._handle_of.get(location)
+                if handle is None:
+                    fill_gap(location)
+                    destination = location
+                elif destination != location:
+                    self._invalidate(location)
+                    ram[destination: destination + seg_size] = ram[location: location + seg_size]
+                    self._handles[handle] = destination
+                    moved += 1
+                    registers_moved += seg_size
+                if handle is not None:
+                    handle_of[destination] = handle
+                destination += seg_size
+            location += seg_size
+        fill_gap(self._heap_end)
+
+        self._handle_of = handle_of
+        for (seg_base, nxt) in zip(free_segments, free_segments[1:] + [-1]):
+            ram[seg_base] = nxt
+        self._free = free_segments[0] if free_segments else -1
+        self._reindex()
+
+        elapsed = time.perf_counter_ns() - started
+        self._defrag_ns += elapsed
+        return CompactionReport(moved, registers_moved, len(free_segments), elapsed / 1e9)
+
+    def _push_free(self, seg_base):
+        """ Adds the segment at `seg_base` to the head of the free list.
+
+        Alongside the 'next' pointers held in the segments themselves, the memory keeps a table of 'previous' pointers
+        (self._back) so that any segment can be removed from the free list without walking it, and a table mapping the
+        address just beyond each free segment to that segment's base (self._ends).
+
+        :param seg_base: an address pointing to the start of a memory segment.
+        """
+        self._ram[seg_base] = self._free
+        if self._free != -1:
+            self._back[self._free] = seg_base
+        self._back[seg_base] = -1
+        self._ends[seg_base + self._ram[seg_base + 1]] = seg_base
+        self._free_starts.add(seg_base)
+        self._count_free_size(self._ram[seg_base + 1], 1)
+        self._free_registers += self._ram[seg_base + 1]
+        self._free = seg_base
+        self._policy.inserted(seg_base)
+
+    def _unlink_free(self, seg_base):
+        """ Removes the segment at `seg_base` from the free list. The segment's header is left untouched.
+
+        :param seg_base: an address pointing to the start of a segment on the free list.
+        """
+        self._policy.removed(seg_base)
+        del self._ends[seg_base + self._ram[seg_base + 1]]
+        self._free_starts.remove(seg_base)
+        self._count_free_size(self._ram[seg_base + 1], -1)
+        self._free_registers -= self._ram[seg_base + 1]
+        previous = self._back.pop(seg_base)
+        nxt = self._ram[seg_base]
+        if previous == -1:
+            self._free = nxt
+        else:
+            self._ram[previous] = nxt
+        if nxt != -1:
+            self._back[nxt] = previous
+
+    def _resize_free(self, seg_base, new_size):
+        """ Changes the total size of a segment on the free list without moving it.
+
+        :param seg_base: an address pointing to the start of a segment on the free list.
+        :param new_size: the segment's new total size (book-keeping registers included).
+        """
+        old_size = self._ram[seg_base + 1]
+        del self._ends[seg_base + old_size]
+        self._ram[seg_base + 1] = new_size
+        self._ends[seg_base + new_size] = seg_base
+        self._count_free_size(old_size, -1)
+        self._count_free_size(new_size, 1)
+        self._free_registers += new_size - old_size
+        self._policy.resized(seg_base, old_size)
+
+    def _count_free_size(self, seg_size, change):
+        """ Adjusts the number of free segments `seg_size` registers long by `change`, keeping the sorted list of
+        distinct free segment sizes (self._sizes) in step. """
+        count = self._free_sizes.get(seg_size, 0) + change
+        if count:
+            if count == 1 and change > 0:
+                insort(self._sizes, seg_size)
+            self._free_sizes[seg_size] = count
+        else:
+            del self._free_sizes[seg_size]
+            del self._sizes[bisect_left(self._sizes, seg_size)]
+
+    def _fits(self, size):
+        """ Returns True if some free segment is large enough to service a request for `size` registers. Takes constant
+        time, so that requests that cannot possibly be met are turned down without consulting the policy. """
+        return bool(self._sizes) and self._sizes[-1] >= size + 2
+
+    @property
+    def metrics(self):
+        """ A Metrics namedtuple describing the current state of the heap and the work done by the memory so far.
+
+        free_segments, free_registers and largest_free (the total size of the largest free segment) describe the free
+        list; fragmentation is 1 - largest_free / free_registers (0 when all free memory sits in one segment). allocs
+        counts successful alloc requests, split into those met by splitting a segment and those met with a whole one;
+        failures counts the requests that could not be met. walked_per_alloc is the average number of free segments
+        examined by the allocation policy per request, deallocs counts deAlloc requests, and defrag_seconds is the
+        time spent in defrag, defrag_step and automatic defragmentation. The figures are kept up to date as the memory
+        is used rather than being recomputed from the chip, so reading them takes constant time.
+        """
+        largest = self._sizes[-1] if self._sizes else 0
+        allocs = self._splits + self._whole
+        return Metrics(free_segments=len(self._back),
+                       free_registers=self._free_registers,
+                       largest_free=largest,
+                       fragmentation=1 - largest / self._free_registers if self._free_registers else 0.0,
+                       allocs=allocs,
+                       splits=self._splits,
+                       whole_segments=self._whole,
+                       failures=self._failures,
+                       walked_per_alloc=self._walked / (allocs + self._failures) if allocs + self._failures else 0.0,
+                       deallocs=self._deallocs,
+                       defrag_seconds=self._defrag_ns / 1e9)
 
     def _peek(self, addr):
         """ Returns the value stored in the register referenced by `addr`.
@@ -189,9 +910,19 @@ class Memory:
         :param seg_base:
         :param value:
         """
-        available_size = self._ram[seg_base + 1] - 2
-        for i in range(0, available_size):
-            self._ram[seg_base + 2 + i] = value
+        fill(self._ram, seg_base + 2, seg_base + self._ram[seg_base + 1], value)
+
+    def _mark_segment(self, seg_base, marker):
+        """ Fills the user-accessible registers in the segment addressed by seg_base with `marker` (TICK or CROSS),
+        unless markers are turned off. """
+        if self._markers:
+            fill(self._ram, seg_base + 2, seg_base + self._ram[seg_base + 1], marker)
+
+    def _mark(self, start, stop, marker):
+        """ Fills the registers from `start` up to (but not including) `stop` with `marker`, unless markers are turned
+        off. """
+        if self._markers:
+            fill(self._ram, start, stop, marker)
 
     @property
     def _free_list(self):
@@ -209,20 +940,19 @@ class Memory:
 
         :return: a list of memory addresses corresponding to unallocated segments of memory.
         """
-        if self._free == -1:
-            return []
-        else:
-            locations = [self._free]
-            nxt = self._ram[self._free]
-            while nxt != -1:
-                locations.append(nxt)
-                nxt = self._ram[nxt]
-            return locations
+        return list(self._iter_free())
+
+    def _iter_free(self):
+        """ Generates the addresses in the free list (see _free_list) one at a time. """
+        nxt = self._free
+        while nxt != -1:
+            yield nxt
+            nxt = self._ram[nxt]
 
     @property
     def heap_size(self):
         """ The size of the heap section of the memory unit. """
-        return len(self._ram) - self.stack_size
+        return self._heap_end - self.stack_size
 
     @property
     def stack_size(self):
@@ -231,15 +961,21 @@ class Memory:
 
     @property
     def log(self):
-        """ A string containing the details of all received alloc and deAlloc calls. """
-        report = "ALLOCATIONS LOG\n---------------\n"
-        for (i, entry) in enumerate(self._log):
-            timing = len(self._log) - i
+        """ A string containing the details of all received alloc and deAlloc calls (most recent first). """
+        return "".join(self._log_lines())
+
+    def _log_lines(self):
+        """ Generates the lines of the log, one at a time, newest entry first. """
+        yield "ALLOCATIONS LOG\n---------------\n"
+        if self._log is None:
+            yield "(logging is turned off)\n"
+            return
+        for (i, entry) in enumerate(reversed(self._log)):
+            timing = self._log_count - i
             if len(entry) == 1:
-                report += "{}.\t\tdeAlloc({})\n".format(timing, entry.addr)
+                yield "{}.\t\tdeAlloc({})\n".format(timing, entry.addr)
             else:
-                report += "{}.\t\talloc({}) -> {}\n".format(timing, entry.size, entry.addr)
-        return report
+                yield "{}.\t\talloc({}) -> {}\n".format(timing, entry.size, entry.addr)
 
     def _report_string(self, repairs_checklist=None):
         """ Returns a string summarising the internal state of receiver (See status_report for details.
@@ -247,26 +983,49 @@ class Memory:
         :param path: A RepairsChecklist namedtuple; if none is provided a call to _health_check is made to generate
         one.
         """
+        return "".join(self._report_chunks(repairs_checklist))
+
+    def _report_chunks(self, repairs_checklist=None, run_length=False):
+        """ Generates the report described in status_report, a piece at a time.
+
+        :param repairs_checklist: A RepairsChecklist namedtuple; if none is provided a call to _health_check is made to
+        generate one.
+        :param run_length: if True, the contents of the RAM chip are listed one run of identical registers per line
+        (see _ram_runs) rather than register by register.
+        """
         checklist = self._health_check() if repairs_checklist is None else repairs_checklist
 
         div = "-" * 45
-        report = "- - - - - - - \nMEMORY REPORT\n- - - - - - - \n\n"
-        report += "RAM (✗ = allocated, ✔ = free) \n{}\n{}\n\n{}\n".format(div, self, self.log)
-        report += "FAULTS\n{}\n".format(div)
-        report += "Any Malformed segments?    {}\n".format("YES" if checklist.malformed_segments else "NO")
-        report += "Unexpected register count? {}\n".format("YES" if checklist.bad_register_count else "NO")
-        report += "Malformed free list?       {}\n".format("YES" if checklist.malformed_freelist else "NO")
-        report += "\nFREE LIST\n{}\n".format(div)
-        report += " -> ".join([str(i) for i in self._free_list])
-
-        return report
+        yield "- - - - - - - \nMEMORY REPORT\n- - - - - - - \n\n"
+        yield "RAM (✗ = allocated, ✔ = free) \n{}\n".format(div)
+        yield from self._ram_runs() if run_length else self._ram_chunks()
+        yield "\n\n"
+        yield from self._log_lines()
+        yield "\n"
+        yield "FAULTS\n{}\n".format(div)
+        yield "Any Malformed segments?    {}\n".format("YES" if checklist.malformed_segments else "NO")
+        yield "Unexpected register count? {}\n".format("YES" if checklist.bad_register_count else "NO")
+        yield "Malformed free list?       {}\n".format("YES" if checklist.malformed_freelist else "NO")
+        yield "\nFREE LIST\n{}\n".format(div)
+
+        addresses = []
+        separator = ""  # Goes in front of every chunk of addresses but the first
+        for seg_base in self._iter_free():
+            addresses.append(str(seg_base))
+            if len(addresses) == self.REPORT_CHUNK:
+                yield separator + " -> ".join(addresses)
+                addresses = []
+                separator = " -> "
+        if addresses:
+            yield separator + " -> ".join(addresses)
 
     def status_report(self, path=None):
         """ Returns a string summarising the internal state of receiver.
 
         The returned string reproduces the contents of the RAM chip and the sequence of all of the alloc() and
         deAlloc() calls that the Memory instance has received. It also outputs the results of the tests that contribute
-        to the return value of the  method needs_repairs.
+        to the return value of the  method needs_repairs. For very large chips, write_report produces the same report
+        without holding it in memory.
 
         :param path: a Path object (NOT a string) referencing a file to which the generated report can be written.
         """
@@ -278,13 +1037,30 @@ class Memory:
 
         return report
 
+    def write_report(self, report_file, run_length=False, repairs_checklist=None):
+        """ Writes the report described in status_report to an open file, a chunk at a time, so that the report is
+        never held in memory as a whole.
+
+        :param report_file: a file object, open for writing text.
+        :param run_length: if True, runs of registers holding the same value (such as the long runs of ✔s in a largely
+        empty heap) are written as a single line each.
+        :param repairs_checklist: A RepairsChecklist namedtuple; if none is provided a call to _health_check is made to
+        generate one.
+        """
+        for chunk in self._report_chunks(repairs_checklist, run_length):
+            report_file.write(chunk)
+
     def _health_check(self):
         """ Runs the checks described in needs_repairs. """
         malformed_segments = False
         malformed_free_list = None
         bad_register_count = None
 
-        indexes_of_numbers = [i for i in range(0, len(self._ram)) if isinstance(self._ram[i], int)]
+        if self._markers:
+            indexes_of_numbers = [i for i in range(self._heap_ptr, self._heap_end) if isinstance(self._ram[i], int)]
+        else:
+            # Data-registers may still hold stale header values, so the headers are found by walking the heap instead
+            indexes_of_numbers, malformed_segments = self._walk_headers()
 
         indexes_of_unallocated_segments = []
         indexes_of_allocated_segments = []
@@ -307,13 +1083,66 @@ class Memory:
                 unallocated_register_count += seg_size
                 indexes_of_unallocated_segments.append(index)
 
-        # Checks
-        bad_register_count = unallocated_register_count + allocated_register_count + self.stack_size != len(self._ram)
+        return self._checklist(malformed_segments, indexes_of_unallocated_segments, indexes_of_allocated_segments,
+                               unallocated_register_count, allocated_register_count)
+
+    def _checklist(self, malformed_segments, indexes_of_unallocated_segments, indexes_of_allocated_segments,
+                   unallocated_register_count, allocated_register_count):
+        """ Completes the checks described in needs_repairs, given the results of a sweep of the heap.
+
+        :param malformed_segments: True if the sweep came across a malformed segment.
+        :param indexes_of_unallocated_segments: the addresses of the unallocated segments found, in ascending order.
+        :param indexes_of_allocated_segments: the addresses of the allocated segments found, in ascending order.
+        :param unallocated_register_count: the number of registers in all unallocated segments (inc. 'book-keeping').
+        :param allocated_register_count: the number of registers in all allocated segments (inc. 'book-keeping').
+        :return: a RepairsChecklist.
+        """
+        # Checks (including checks that the incrementally maintained counters and tables agree with the chip)
+        bad_register_count = unallocated_register_count + allocated_register_count + self.stack_size != self._heap_end
+        bad_register_count |= (unallocated_register_count, allocated_register_count) != \
+            (self._free_registers, self._allocated_registers)
         malformed_free_list = sorted(self._free_list) != indexes_of_unallocated_segments
+        malformed_free_list |= sorted(self._back) != indexes_of_unallocated_segments
+        malformed_free_list |= list(self._free_starts) != indexes_of_unallocated_segments
+        malformed_free_list |= self._sizes != sorted({self._ram[index + 1] for index in indexes_of_unallocated_segments})
+        malformed_segments |= list(self._allocated) != indexes_of_allocated_segments
 
         return RepairsChecklist(malformed_segments, bad_register_count, malformed_free_list)
 
-    def needs_repairs(self, path=None):
+    def _quick_check(self):
+        """ A constant-time approximation of _health_check, based on the counters and tables maintained by alloc,
+        deAlloc and defrag, together with a spot-check of the segment most recently allocated or released. """
+        bad_register_count = self._free_registers + self._allocated_registers + self.stack_size != self._heap_end
+        malformed_free_list = (self._free == -1) != (len(self._back) == 0) or \
+            (self._free != -1 and self._back.get(self._free) != -1)
+
+        malformed_segments = False
+        seg_base = self._last_touched
+        is_allocated = seg_base in self._allocated
+        if is_allocated or seg_base in self._back:
+            nxt, seg_size = self._ram[seg_base], self._ram[seg_base + 1]
+            malformed_segments = not (isinstance(nxt, int) and isinstance(seg_size, int) and seg_size >= 3) or \
+                (nxt == -100) != is_allocated
+
+        return RepairsChecklist(malformed_segments, bad_register_count, malformed_free_list)
+
+    def _walk_headers(self):
+        """ Returns a tuple (indexes, malformed) where `indexes` lists the addresses of the book-keeping registers found
+        by stepping from segment to segment across the heap, and `malformed` is True if the walk came across a segment
+        header that does not make sense. """
+        indexes = []
+        location = self._heap_ptr
+        while location < self._heap_end:
+            if location + 1 == self._heap_end:
+                return indexes, True
+            nxt, seg_size = self._ram[location], self._ram[location + 1]
+            if not (isinstance(nxt, int) and isinstance(seg_size, int)) or seg_size < 3:
+                return indexes, True
+            indexes += [location, location + 1]
+            location += seg_size
+        return indexes, location != self._heap_end
+
+    def needs_repairs(self, path=None, fast=False):
         """ Determines whether or not the ram-chip is in a consistent state.
 
         Comprises the following checks:
@@ -322,26 +1151,72 @@ class Memory:
         2. Is every 'free' memory segment referenced in the free_list?
         3. Do all identifiable memory segments have the expected structure (see free_list)
 
+        Each check also confirms that the counters and tables that alloc, deAlloc and defrag keep up to date agree
+        with the contents of the chip. Running all three checks takes time proportional to the size of the chip; with
+        fast=True the checks are answered in constant time from those counters instead, and only the segment most
+        recently allocated or released is examined. If the memory was created with deep_verify_every=N, every Nth
+        fast check runs the full checks regardless.
+
         :param path: a Path object referencing a file to which the generated repairs log can be written. If no
         path is provided no report is created.
+        :param fast: if True, run the constant-time version of the checks.
         :return: True if any one of the three consistency checks fails, False otherwise (indicating a healthy chip).
         """
-        health_check = self._health_check()
+        if fast:
+            self._fast_checks += 1
+            fast = not (self._deep_verify_every and self._fast_checks % self._deep_verify_every == 0)
+        health_check = self._quick_check() if fast else self._health_check()
 
         # Report (if requested)
         if path is not None:
-            report = self._report_string(health_check)
             with open(path.as_posix(), "w+") as logfile:
-                logfile.write(report)
+                self.write_report(logfile, repairs_checklist=health_check)
 
         return health_check.bad_register_count | health_check.malformed_freelist | health_check.malformed_segments
 
     def __str__(self):
         """ A string representation of the contents of the entire memory unit. """
-        lines = [""] * 16
-        for (register, value) in enumerate(self._ram):
-            lines[register % 16] += "{:5}{:10}".format(str(register), str(value))
-        return "\n".join(lines)
+        return "".join(self._ram_chunks())
+
+    def _ram_chunks(self):
+        """ Generates the string representation of the memory unit (see __str__) a chunk of at most REPORT_CHUNK
+        registers at a time.
+
+        Registers are listed in sixteen columns, so that the first line holds registers 0, 16, 32..., the second
+        registers 1, 17, 33... and so on. Each line is produced by reading every sixteenth register of the chip.
+        """
+        size = len(self._ram)
+        span = 16 * self.REPORT_CHUNK
+        for line in range(0, 16):
+            if line > 0:
+                yield "\n"
+            for start in range(line, size, span):
+                values = self._ram[start: min(size, start + span): 16]
+                yield "".join("{:5}{:10}".format(str(register), str(value))
+                              for (register, value) in zip(range(start, size, 16), values))
+
+    def _ram_runs(self):
+        """ Generates a run-length encoded listing of the contents of the memory unit: each run of consecutive registers
+        holding the same value is listed on a single line, together with the number of registers in the run. """
+        size = len(self._ram)
+        lines = []
+        run_start, run_value = 0, None
+        for chunk_start in range(0, size, self.REPORT_CHUNK):
+            for (register, value) in enumerate(self._ram[chunk_start: chunk_start + self.REPORT_CHUNK], chunk_start):
+                if value != run_value or type(value) is not type(run_value):
+                    if register > run_start:
+                        lines.append(self._run_line(run_start, register, run_value))
+                    run_start, run_value = register, value
+            yield "".join(lines)
+            lines = []
+        yield self._run_line(run_start, size, run_value)
+
+    @staticmethod
+    def _run_line(start, stop, value):
+        """ A line of the run-length encoded listing, describing the registers from `start` up to (but not including)
+        `stop`, which all hold `value`. """
+        registers = "{}-{}".format(start, stop - 1) if stop - start > 1 else str(start)
+        return "{:17}{:10}({})\n".format(registers, str(value), stop - start)
 
     def __format__(self, format_spec):
         """ Returns a string representation of the RAM chips' contents.
@@ -350,9 +1225,7 @@ class Memory:
         otherwise specify 'extended' for a richer description.
         """
         if format_spec == "short":
-            ram_string = ""
-            for value in self._ram:
-                ram_string += "N" if value is None else " {}".format(value)
+            ram_string = "".join("N" if value is None else " {}".format(value) for value in self._ram)
         else:
             ram_string = str(self)
 
@@ -0,0 +1,270 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+Parallel versions of the two linear sweeps of the heap - the full health check behind needs_repairs, and defrag - for
+chips held in shared memory (see shared.py). On a chip of hundreds of millions of registers either sweep takes a long
+time on a single core; a ParallelSweeper splits the heap into regions, sweeps the regions in a pool of processes that
+all work directly on the shared registers, and stitches the per-region results together at the seams.
+
+Regions are aligned to segment boundaries, which are taken from the memory's tables of segment starts. As those tables
+are exactly what the health check sets out to verify, the boundaries are treated as no more than hints: a region only
+counts if the sweep of the region before it ended exactly where it begins. Should any region fail to line up, or should
+a region turn out to be malformed, the sweep is run again sequentially, so the results are always identical to those of
+Memory.needs_repairs and Memory.defrag. Defragmentation is split into two rounds for the same reason: no register is
+written until every region has been found to line up.
+"""
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+from .shared import HEADER_WORDS, _created, _open_block
+from .store import TICK, CROSS_CODE, TICK_CODE
+
+
+class _Malformed(Exception):
+    """ Raised by a worker that comes across a segment header that does not make sense. """
+
+
+def _segments(words, start, stop):
+    """ Generates a tuple (seg_base, nxt, seg_size) for each segment from `start` up to `stop`, reading the register
+    codes in `words` (the whole shared block, header included).
+
+    :raises _Malformed: if a header does not make sense, or the last segment does not end exactly at `stop`.
+    """
+    location = start
+    while location < stop:
+        if location + 1 == stop:
+            raise _Malformed()
+        nxt, seg_size = words[HEADER_WORDS + location], words[HEADER_WORDS + location + 1]
+        if nxt <= CROSS_CODE or seg_size <= CROSS_CODE or seg_size < 3:
+            raise _Malformed()  # Not a pair of integers, or too small to be a segment
+        yield location, nxt, seg_size
+        location += seg_size
+    if location != stop:
+        raise _Malformed()
+
+
+def _check_region(name, registered, start, stop, markers):
+    """ Sweeps the region of the heap from `start` up to `stop` on behalf of the health check (see
+    Memory._health_check). Runs in a worker process.
+
+    :return: None if the region is malformed, or doesn't end at `stop`; otherwise a tuple (free, allocated, free_count,
+    allocated_count): arrays of the addresses of the free and the allocated segments, and the number of registers in
+    each kind of segment.
+    """
+    block = _open_block(name, registered)
+    words = block.buf.cast("q")
+    try:
+        free, allocated = array("q"), array("q")
+        counts = [0, 0]
+        if markers:
+            # As in the sequential check, headers are found by looking for registers that hold integers
+            registers = words[HEADER_WORDS + start: HEADER_WORDS + stop]
+            indexes = [i for (i, code) in enumerate(registers, start) if code > CROSS_CODE]
+            registers.release()
+            if len(indexes) % 2:
+                return None
+            headers = []
+            for i in range(0, len(indexes), 2):
+                if indexes[i + 1] != indexes[i] + 1:
+                    return None
+                headers.append((indexes[i], words[HEADER_WORDS + indexes[i]], words[HEADER_WORDS + indexes[i] + 1]))
+        else:
+            try:
+                headers = list(_segments(words, start, stop))
+            except _Malformed:
+                return None
+
+        for (seg_base, nxt, seg_size) in headers:
+            is_allocated = nxt == -100
+            (allocated if is_allocated else free).append(seg_base)
+            counts[is_allocated] += seg_size
+        return free, allocated, counts[0], counts[1]
+    finally:
+        words.release()
+        block.close()
+
+
+def _region_lines_up(name, registered, start, stop):
+    """ Returns True if the segments from `start` onwards are well formed, and end exactly at `stop`. Runs in a worker
+    process. """
+    block = _open_block(name, registered)
+    words = block.buf.cast("q")
+    try:
+        for _ in _segments(words, start, stop):
+            pass
+        return True
+    except _Malformed:
+        return False
+    finally:
+        words.release()
+        block.close()
+
+
+def _defrag_region(name, registered, start, stop, markers):
+    """ Combines the runs of contiguous free segments that lie between `start` and `stop` (see Memory.defrag), and links
+    the resulting segments to one another in ascending order of address; the last is left pointing nowhere (-1). Runs
+    in a worker process.
+
+    :return: an array holding the start and width of each free segment in the region, in ascending order of address.
+    """
+    block = _open_block(name, registered)
+    words = block.buf.cast("q")
+    try:
+        blocks = array("q")
+        location = start
+        while location < stop:
+            if words[HEADER_WORDS + location] != -100:
+                block_start = location
+                words[HEADER_WORDS + block_start] = -1
+                block_width = words[HEADER_WORDS + location + 1]
+                location += block_width
+                while location < stop and words[HEADER_WORDS + location] != -100:
+                    segment_width = words[HEADER_WORDS + location + 1]
+                    block_width += segment_width
+                    if markers:
+                        words[HEADER_WORDS + location] = words[HEADER_WORDS + location + 1] = TICK_CODE
+                    location += segment_width
+                words[HEADER_WORDS + block_start + 1] = block_width
+
+                if blocks:
+                    words[HEADER_WORDS + blocks[-2]] = block_start
+                blocks.extend((block_start, block_width))
+            else:
+                location += words[HEADER_WORDS + location + 1]
+        return blocks
+    finally:
+        words.release()
+        block.close()
+
+
+class ParallelSweeper:
+    """ Runs the health check and defrag of a shared chip (a shared.SharedMemory) across a pool of processes. """
+
+    def __init__(self, shared, processes=None, regions=None, executor=None):
+        """ Creates a sweeper for the chip managed by `shared`.
+
+        :param shared: the SharedMemory instance whose chip is to be swept.
+        :param processes: the number of worker processes (by default, the number of CPUs).
+        :param regions: the number of regions into which the heap is split (by default, one per worker process).
+        :param executor: an existing concurrent.futures executor to run the sweeps on, instead of a pool of the
+        sweeper's own. The executor is not shut down by close.
+        """
+        processes = processes or os.cpu_count() or 1
+        self._shared = shared
+        self._regions = regions or processes
+        self._owns_executor = executor is None
+        self._executor = ProcessPoolExecutor(processes) if executor is None else executor
+
+    def needs_repairs(self, path=None):
+        """ Runs the full set of checks described in Memory.needs_repairs, sweeping the regions of the heap in parallel.
+
+        :param path: a Path object referencing a file to which the generated repairs log can be written.
+        :return: True if any one of the consistency checks fails, False otherwise (indicating a healthy chip).
+        """
+        with self._shared._lock:
+            self._shared._sync()
+            memory = self._shared.memory
+            health_check = self._health_check(memory)
+            if path is not None:
+                with open(path.as_posix(), "w+") as logfile:
+                    memory.write_report(logfile, repairs_checklist=health_check)
+
+        return health_check.bad_register_count | health_check.malformed_freelist | health_check.malformed_segments
+
+    def _health_check(self, memory):
+        """ Returns the RepairsChecklist that memory._health_check would return. """
+        starts = self._starts(memory)
+        results = list(self._executor.map(_check_region, *self._arguments(starts, memory._markers)))
+        if None in results:
+            return memory._health_check()  # Leave it to the sequential check to report on the damage
+
+        free, allocated = [], []
+        free_count = allocated_count = 0
+        for (region_free, region_allocated, region_free_count, region_allocated_count) in results:
+            free.extend(region_free)
+            allocated.extend(region_allocated)
+            free_count += region_free_count
+            allocated_count += region_allocated_count
+        return memory._checklist(False, free, allocated, free_count, allocated_count)
+
+    def defrag(self):
+        """ Defragments the chip exactly as Memory.defrag would, coalescing the regions of the heap in parallel.
+
+        Each region's runs of free segments are combined by a worker process; a run that straddles the seam between two
+        regions is completed once the workers have finished.
+        """
+        with self._shared._lock:
+            self._shared._sync()
+            self._defrag(self._shared.memory)
+            self._shared._publish()
+
+    def _defrag(self, memory):
+        """ Does the work of defrag. """
+        started = time.perf_counter_ns()
+        starts = self._starts(memory)
+        if not all(self._executor.map(_region_lines_up, *self._arguments(starts))):
+            memory.defrag()
+            return
+
+        ram = memory._ram
+        headers = {start: ram[start: start + 2] for start in starts}  # As they were before the workers set to work
+        blocks = []
+        for region_blocks in self._executor.map(_defrag_region, *self._arguments(starts, memory._markers)):
+            pairs = list(zip(region_blocks[0::2], region_blocks[1::2]))
+            if blocks and pairs and sum(blocks[-1]) == pairs[0][0]:
+                # A run of free segments straddles the seam: the region's first segment joins the last one found so far
+                (block_start, block_width), (follower, follower_width) = blocks[-1], pairs.pop(0)
+                ram[block_start] = ram[follower]
+                ram[block_start + 1] = block_width + follower_width
+                ram[follower: follower + 2] = headers[follower]  # Memory.defrag leaves absorbed headers as they were...
+                memory._mark(follower, follower + 2, TICK)       # ...unless markers are on
+                blocks[-1] = (block_start, block_width + follower_width)
+            elif blocks and pairs:
+                ram[blocks[-1][0]] = pairs[0][0]
+            blocks.extend(pairs)
+
+        memory._defrag_cursor = memory._heap_ptr
+        memory._index_free(blocks)
+        memory._defrag_ns += time.perf_counter_ns() - started
+
+    def _starts(self, memory):
+        """ Returns the addresses at which the regions of the heap start, in ascending order.
+
+        The heap is cut into `regions` parts of (roughly) equal size, and each cut is moved up to the next segment that
+        the memory's tables know of, so there may be fewer regions than asked for.
+        """
+        heap_ptr, heap_end = memory._heap_ptr, memory._heap_end
+        starts = [heap_ptr]
+        for i in range(1, self._regions):
+            cut = heap_ptr + (heap_end - heap_ptr) * i // self._regions
+            candidates = [seg_base for seg_base in (memory._allocated.next_set(cut, heap_end),
+                                                    memory._free_starts.next_set(cut, heap_end))
+                          if seg_base is not None]
+            if candidates and min(candidates) > starts[-1]:
+                starts.append(min(candidates))
+        return starts
+
+    def _arguments(self, starts, *extra):
+        """ Returns the argument lists with which a worker function is mapped over the regions that start at `starts`:
+        each worker is passed the name of the shared block, whether the block is registered with the resource tracker
+        (see shared._open_block), the start and end of its region, and then the values in `extra`. """
+        name = self._shared.name
+        stops = starts[1:] + [self._shared.memory._heap_end]
+        return ([name] * len(starts), [name in _created] * len(starts), starts, stops) + \
+            tuple([value] * len(starts) for value in extra)
+
+    def close(self):
+        """ Shuts down the sweeper's pool of worker processes (if it has one of its own). """
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
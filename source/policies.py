@@ -0,0 +1,196 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+Allocation policies for the Memory class. A policy decides which free segment should be used to service an alloc request;
+the Memory instance it is attached to remains responsible for splitting segments and maintaining the free list. Policies
+that keep their own index of the free segments are told about every change to the free list via the hooks defined by
+AllocationPolicy, so that they never need to walk the list.
+
+The following policies are available: first-fit (the default), next-fit, best-fit, worst-fit and segregated.
+"""
+
+from bisect import bisect_left, insort
+
+
+class AllocationPolicy:
+    """ The interface shared by all allocation policies.
+
+    A segment 'fits' a request for `size` registers if its total size (book-keeping registers included) is at least
+    `size` + 2. The hooks are called by Memory whenever a segment joins, leaves or changes size while on the free list;
+    the segment's header is intact (and still holds its size) at the time each hook is called.
+    """
+
+    name = None
+
+    def attach(self, memory):
+        """ Binds the policy to `memory`, and indexes its current free list. """
+        self._memory = memory
+        self.reset()
+
+    def reset(self):
+        """ Discards any state held by the policy and rebuilds it from the free list (called after defrag). """
+
+    def inserted(self, seg_base):
+        """ Called when the segment at `seg_base` has been added to the free list. """
+
+    def removed(self, seg_base):
+        """ Called when the segment at `seg_base` is about to be removed from the free list. """
+
+    def resized(self, seg_base, old_size):
+        """ Called when a free segment has been shrunk or grown in place; `old_size` is its previous total size. """
+
+    def find(self, size):
+        """ Returns the base address of a free segment that fits a request for `size` registers, or None. The number of
+        free segments examined along the way should be added to the memory's running total (memory._walked, reported
+        by Memory.metrics).
+
+        :param size: the number of data-registers requested by the client.
+        """
+        raise NotImplementedError
+
+
+class FirstFit(AllocationPolicy):
+    """ Walks the free list from its head and picks the first segment large enough to service the request. """
+
+    name = "first-fit"
+
+    def find(self, size):
+        return self.find_from(size, self._memory._free)
+
+    def find_from(self, size, seg_base):
+        """ Like find, but starts the walk at `seg_base` (a segment on the free list, or -1) rather than at the head.
+        """
+        ram = self._memory._ram
+        walked = 0
+        while seg_base != -1:
+            walked += 1
+            if ram[seg_base + 1] >= size + 2:
+                break
+            seg_base = ram[seg_base]
+        self._memory._walked += walked
+        return seg_base if seg_base != -1 else None
+
+
+class NextFit(AllocationPolicy):
+    """ Like first-fit, but each search resumes from the point at which the previous search stopped (the 'rover'),
+    wrapping around to the head of the free list when it reaches the end. """
+
+    name = "next-fit"
+
+    def reset(self):
+        self._rover = self._memory._free
+
+    def removed(self, seg_base):
+        if seg_base == self._rover:
+            self._rover = self._memory._ram[seg_base]
+
+    def find(self, size):
+        memory = self._memory
+        ram = memory._ram
+        start = self._rover if self._rover != -1 else memory._free
+        seg_base = start
+        while seg_base != -1:
+            memory._walked += 1
+            if ram[seg_base + 1] >= size + 2:
+                self._rover = seg_base
+                return seg_base
+            seg_base = ram[seg_base]
+            if seg_base == -1:
+                seg_base = memory._free
+            if seg_base == start:
+                break
+        return None
+
+
+class _SizeOrderedPolicy(AllocationPolicy):
+    """ Keeps the free segments in a list of (total size, base address) pairs, ordered by size and then by address. """
+
+    def reset(self):
+        ram = self._memory._ram
+        self._index = sorted((ram[seg_base + 1], seg_base) for seg_base in self._memory._free_list)
+
+    def inserted(self, seg_base):
+        insort(self._index, (self._memory._ram[seg_base + 1], seg_base))
+
+    def removed(self, seg_base):
+        del self._index[bisect_left(self._index, (self._memory._ram[seg_base + 1], seg_base))]
+
+    def resized(self, seg_base, old_size):
+        del self._index[bisect_left(self._index, (old_size, seg_base))]
+        self.inserted(seg_base)
+
+
+class BestFit(_SizeOrderedPolicy):
+    """ Picks the smallest segment large enough to service the request (the lowest address wins a tie). """
+
+    name = "best-fit"
+
+    def find(self, size):
+        self._memory._walked += 1
+        position = bisect_left(self._index, (size + 2, -1))
+        return self._index[position][1] if position < len(self._index) else None
+
+
+class WorstFit(_SizeOrderedPolicy):
+    """ Picks the largest free segment, provided it is large enough to service the request. """
+
+    name = "worst-fit"
+
+    def find(self, size):
+        self._memory._walked += 1
+        if self._index and self._index[-1][0] >= size + 2:
+            return self._index[-1][1]
+        return None
+
+
+class Segregated(AllocationPolicy):
+    """ Keeps one free list per power-of-two size class. A request is serviced from its own class if possible, and
+    otherwise from the smallest non-empty class above it (every segment of which is guaranteed to fit). """
+
+    name = "segregated"
+
+    def reset(self):
+        self._classes = [{} for _ in range(64)]
+        for seg_base in self._memory._free_list:
+            self.inserted(seg_base)
+
+    def inserted(self, seg_base):
+        self._classes[self._memory._ram[seg_base + 1].bit_length()][seg_base] = None
+
+    def removed(self, seg_base):
+        del self._classes[self._memory._ram[seg_base + 1].bit_length()][seg_base]
+
+    def resized(self, seg_base, old_size):
+        del self._classes[old_size.bit_length()][seg_base]
+        self.inserted(seg_base)
+
+    def find(self, size):
+        ram = self._memory._ram
+        size_class = (size + 2).bit_length()
+        for seg_base in self._classes[size_class]:
+            self._memory._walked += 1
+            if ram[seg_base + 1] >= size + 2:
+                return seg_base
+        for segments in self._classes[size_class + 1:]:
+            if segments:
+                self._memory._walked += 1
+                return next(iter(segments))
+        return None
+
+
+POLICIES = {policy.name: policy for policy in (FirstFit, NextFit, BestFit, WorstFit, Segregated)}
+
+
+def make_policy(policy):
+    """ Returns an AllocationPolicy instance.
+
+    :param policy: either the name of one of the policies in POLICIES, or an AllocationPolicy instance.
+    """
+    if isinstance(policy, AllocationPolicy):
+        return policy
+    try:
+        return POLICIES[policy]()
+    except KeyError:
+        raise ValueError("unknown allocation policy '{}'".format(policy)) from None
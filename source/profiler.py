@@ -0,0 +1,155 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+An allocation profiler for the Memory class. The Memory log records what was allocated and released, but not who asked
+for it or how long it was kept; an AllocationProfiler fills that gap. It follows a memory through a hook (see
+Memory.add_hook), tags each sampled allocation with the site it was requested from (the first line of client code on the
+call stack) and the time it was made, and aggregates, for each site: the number of allocations and registers requested,
+the blocks still live, a histogram of the lifetimes of the blocks released, and the number of requests that failed.
+
+Only one allocation in every `sample_every` is tagged, so the profiler can be left running on a busy memory: an
+allocation that is not sampled costs a counter decrement, and a release a single dictionary lookup. Failed requests are
+rare and important enough to be attributed every time. The counts for sampled allocations can be scaled up by
+`sample_every` to estimate the totals.
+
+Blocks moved by Memory.compact, or resized in place by Memory.realloc, are not followed: the profiler keeps to the
+address and size at which a block was allocated.
+"""
+
+from collections import namedtuple
+import json
+import os.path
+import sys
+import time
+
+from .memory import Dealloc
+
+SiteStats = namedtuple("SiteStats", "site allocs registers live_blocks live_registers failures lifetimes")
+
+_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Site:
+    """ The running totals for a single allocation site. """
+
+    __slots__ = ("allocs", "registers", "live_blocks", "live_registers", "failures", "lifetimes")
+
+    def __init__(self):
+        self.allocs = 0
+        self.registers = 0
+        self.live_blocks = 0
+        self.live_registers = 0
+        self.failures = 0
+        self.lifetimes = {}  # Lifetime bucket -> number of blocks (see AllocationProfiler._lifetime_bucket)
+
+
+class AllocationProfiler:
+    """ Attributes the allocations made from a Memory instance to the sites in the client code that requested them. """
+
+    def __init__(self, memory, sample_every=1):
+        """ Starts profiling `memory`.
+
+        :param memory: the Memory instance to profile.
+        :param sample_every: profile one allocation in every `sample_every` (1, the default, profiles every one).
+        """
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self._memory = memory
+        self._sample_every = sample_every
+        self._countdown = 1     # The number of allocations still to go before the next one is sampled
+        self._sites = {}        # (filename, line number, function name) -> _Site
+        self._live = {}         # Address of a sampled block that has not yet been released -> (site, size, timestamp)
+        memory.add_hook(self._hook)
+
+    def close(self):
+        """ Stops profiling (the results gathered so far remain available). """
+        self._memory.remove_hook(self._hook)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _hook(self, entry, elapsed):
+        """ Called by the memory after every alloc and deAlloc call (see Memory.add_hook). """
+        if type(entry) is Dealloc:
+            if self._live:
+                sample = self._live.pop(entry.addr, None)
+                if sample is not None:
+                    self._released(sample)
+        elif entry.addr is None or entry.addr < 0:
+            self._site()[1].failures += 1
+        else:
+            self._countdown -= 1
+            if self._countdown == 0:
+                self._countdown = self._sample_every
+                key, site = self._site()
+                site.allocs += 1
+                site.registers += entry.size
+                site.live_blocks += 1
+                site.live_registers += entry.size
+                self._live[entry.addr] = (key, entry.size, time.monotonic_ns())
+
+    def _released(self, sample):
+        """ Records the release of a sampled block. """
+        (key, size, allocated_at) = sample
+        site = self._sites[key]
+        site.live_blocks -= 1
+        site.live_registers -= size
+        bucket = self._lifetime_bucket(time.monotonic_ns() - allocated_at)
+        site.lifetimes[bucket] = site.lifetimes.get(bucket, 0) + 1
+
+    @staticmethod
+    def _lifetime_bucket(lifetime):
+        """ Returns the upper bound (in nanoseconds) of the histogram bucket for a block that lived `lifetime`
+        nanoseconds. Buckets double in width: a block lands in the smallest power of two greater than its lifetime. """
+        return 1 << lifetime.bit_length()
+
+    def _site(self):
+        """ Returns the key and the running totals of the site from which the current alloc call was made: the
+        innermost frame on the call stack that lies outside this package. """
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE):
+            frame = frame.f_back
+        key = ("<unknown>", 0, "") if frame is None else \
+            (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = _Site()
+        return key, site
+
+    @property
+    def sample_every(self):
+        """ The sampling interval: one allocation in every `sample_every` is profiled. """
+        return self._sample_every
+
+    def report(self):
+        """ Returns the results gathered so far.
+
+        :return: a list holding a SiteStats namedtuple for each site, those with the most live registers first. `site`
+        is a string naming the file, line and function; `allocs`, `registers`, `live_blocks` and `live_registers` count
+        sampled allocations only; `failures` counts every failed request; and `lifetimes` is a tuple of (upper bound in
+        nanoseconds, number of blocks) pairs, in ascending order, for the sampled blocks that have been released.
+        """
+        stats = [SiteStats("{}:{} ({})".format(*key), site.allocs, site.registers, site.live_blocks, site.live_registers,
+                           site.failures, tuple(sorted(site.lifetimes.items())))
+                 for (key, site) in self._sites.items()]
+        return sorted(stats, key=lambda stat: (-stat.live_registers, -stat.registers, -stat.failures, stat.site))
+
+    def export(self, path):
+        """ Writes the results gathered so far (see report) to a JSON file.
+
+        :param path: a Path object referencing the file to be written.
+        """
+        sites = [dict(stat._asdict(), lifetimes=[list(bucket) for bucket in stat.lifetimes]) for stat in self.report()]
+        with open(path.as_posix(), "w") as report_file:
+            json.dump({"sample_every": self._sample_every, "sites": sites}, report_file, indent=2)
+
+    def reset(self):
+        """ Discards the results gathered so far; blocks that are currently live are no longer followed. """
+        self._sites = {}
+        self._live = {}
+        self._countdown = 1
@@ -0,0 +1,193 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+Tools for replaying recorded sequences of alloc and deAlloc calls (traces) against a Memory instance. A trace is simply
+a list of Alloc and Dealloc namedtuples in the order in which the calls were made. Traces can be read from, and written
+to, text files that use the same notation as the Memory log, so the log section of a status report can be replayed
+directly. Synthetic traces, useful for benchmarking, can be generated with synthetic_trace.
+"""
+
+from collections import namedtuple
+import random
+import re
+import time
+
+from .memory import Alloc, Dealloc
+
+ReplayReport = namedtuple("ReplayReport", "ops seconds ops_per_sec latency_ns peak_fragmentation failures failure_rate")
+
+_ALLOC_PATTERN = re.compile(r"^\s*(?:(\d+)\.)?\s*alloc\((\d+)\) -> (-?\d+|None)\s*$")
+_DEALLOC_PATTERN = re.compile(r"^\s*(?:(\d+)\.)?\s*deAlloc\((-?\d+)\)\s*$")
+
+TRACE_KINDS = ("uniform", "power-law", "lifo", "fifo", "churn")
+
+
+def read_trace(path):
+    """ Reads a trace from a text file.
+
+    Each alloc or deAlloc call occupies a line of its own, written as in the Memory log ('alloc(7) -> 57' or
+    'deAlloc(57)'). Lines may be numbered ('3.\t\tdeAlloc(57)'), in which case the calls are sorted into numerical
+    order; this allows a Memory log, which lists the most recent call first, to be read as it is. All other lines
+    are ignored.
+
+    :param path: a Path object referencing the trace file.
+    :return: a list of Alloc and Dealloc namedtuples.
+    """
+    numbered = []
+    with open(path.as_posix()) as trace_file:
+        for (line_number, line) in enumerate(trace_file):
+            match = _ALLOC_PATTERN.match(line)
+            if match:
+                addr = None if match.group(3) == "None" else int(match.group(3))
+                event = Alloc(int(match.group(2)), addr)
+            else:
+                match = _DEALLOC_PATTERN.match(line)
+                if not match:
+                    continue
+                event = Dealloc(int(match.group(2)))
+            numbered.append((int(match.group(1)) if match.group(1) else line_number, event))
+
+    return [event for (_, event) in sorted(numbered, key=lambda item: item[0])]
+
+
+def write_trace(events, path):
+    """ Writes a trace to a text file, one call per line in the order in which the calls were made.
+
+    :param events: an iterable of Alloc and Dealloc namedtuples.
+    :param path: a Path object referencing the file to be written.
+    """
+    with open(path.as_posix(), "w") as trace_file:
+        for event in events:
+            if len(event) == 1:
+                trace_file.write("deAlloc({})\n".format(event.addr))
+            else:
+                trace_file.write("alloc({}) -> {}\n".format(event.size, event.addr))
+
+
+def replay(memory, events, sample_every=64):
+    """ Drives `memory` with the calls recorded in a trace, and reports on its performance.
+
+    The addresses in a trace are those returned when the trace was recorded, and will generally differ from those
+    returned by `memory`; each recorded address is therefore mapped to the pointer returned by `memory` for the same
+    request, and deAlloc calls are translated accordingly. A recorded deAlloc whose matching alloc failed during the
+    replay (or that has no matching alloc) is skipped.
+
+    :param memory: the Memory instance to drive.
+    :param events: an iterable of Alloc and Dealloc namedtuples.
+    :param sample_every: the fragmentation of the heap is measured after every `sample_every` calls. The time taken to
+    measure it is not counted in `seconds`, so it does not drag down `ops_per_sec`.
+    :return: a ReplayReport. `latency_ns` is a dict of per-call latencies in nanoseconds ('p50', 'p90', 'p99' and
+    'max'); `peak_fragmentation` is the highest observed value of 1 - (largest free segment / total free registers).
+    """
+    live = {}
+    latencies = []
+    allocs = failures = 0
+    peak_fragmentation = 0.0
+    sampling_ns = 0  # Time spent measuring fragmentation, which is left out of the timings
+    clock = time.perf_counter_ns
+
+    started = clock()
+    for event in events:
+        if len(event) == 1:
+            ptr = live.pop(event.addr, None)
+            if ptr is None:
+                continue
+            before = clock()
+            memory.deAlloc(ptr)
+            latencies.append(clock() - before)
+        else:
+            before = clock()
+            ptr = memory.alloc(event.size)
+            latencies.append(clock() - before)
+            allocs += 1
+            if ptr is None:
+                failures += 1
+            elif event.addr not in (None, -1):
+                live[event.addr] = ptr
+
+        if len(latencies) % sample_every == 0:
+            before = clock()
+            peak_fragmentation = max(peak_fragmentation, fragmentation(memory))
+            sampling_ns += clock() - before
+    seconds = (clock() - started - sampling_ns) / 1e9
+
+    peak_fragmentation = max(peak_fragmentation, fragmentation(memory))
+    latencies.sort()
+    return ReplayReport(ops=len(latencies),
+                        seconds=seconds,
+                        ops_per_sec=len(latencies) / seconds if seconds else float("inf"),
+                        latency_ns={"p50": _percentile(latencies, 50),
+                                    "p90": _percentile(latencies, 90),
+                                    "p99": _percentile(latencies, 99),
+                                    "max": latencies[-1] if latencies else 0},
+                        peak_fragmentation=peak_fragmentation,
+                        failures=failures,
+                        failure_rate=failures / allocs if allocs else 0.0)
+
+
+def fragmentation(memory):
+    """ Returns the external fragmentation of the heap: 1 - (largest free segment / total free registers), which is 0
+    when all free memory sits in a single segment (or there is none) and approaches 1 as it is split into many small
+    pieces. """
+    sizes = [memory._peek(seg_base + 1) for seg_base in memory._free_list]
+    return 1 - max(sizes) / sum(sizes) if sizes else 0.0
+
+
+def _percentile(ordered, percent):
+    """ Returns the nearest-rank `percent` percentile of a sorted list (0 if the list is empty). """
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, (len(ordered) * percent + 99) // 100 - 1))]
+
+
+def synthetic_trace(kind, ops, max_size=16, live=64, seed=0):
+    """ Generates a synthetic trace.
+
+    The Alloc events of a synthetic trace carry sequence numbers rather than real addresses; replay maps these to live
+    pointers just as it would map recorded addresses.
+
+    :param kind: one of TRACE_KINDS:
+        'uniform' - request sizes drawn uniformly from 1..max_size; random blocks are freed once `live` are held.
+        'power-law' - as 'uniform', but small requests are far more common than large ones.
+        'lifo' - blocks are freed in the reverse of the order in which they were allocated (a stack).
+        'fifo' - blocks are freed in the order in which they were allocated (a queue).
+        'churn' - every call is equally likely to be an alloc or a deAlloc of a random live block.
+    :param ops: the number of events in the trace.
+    :param max_size: the largest request size.
+    :param live: the number of blocks held before blocks start being freed ('uniform', 'power-law', 'lifo', 'fifo').
+    :param seed: the seed of the random number generator, so that traces can be reproduced.
+    :return: a list of Alloc and Dealloc namedtuples.
+    """
+    if kind not in TRACE_KINDS:
+        raise ValueError("unknown trace kind '{}'".format(kind))
+
+    rng = random.Random(seed)
+    events = []
+    held = []
+    counter = 0
+
+    def size():
+        if kind == "power-law":
+            return min(max_size, int(rng.paretovariate(1.2)))
+        return rng.randint(1, max_size)
+
+    while len(events) < ops:
+        if kind == "churn":
+            freeing = held and rng.random() < 0.5
+        else:
+            freeing = len(held) >= live
+        if freeing:
+            if kind == "lifo":
+                index = len(held) - 1
+            elif kind == "fifo":
+                index = 0
+            else:
+                index = rng.randrange(len(held))
+            events.append(Dealloc(held.pop(index)))
+        else:
+            counter += 1
+            held.append(counter)
+            events.append(Alloc(size(), counter))
+    return events
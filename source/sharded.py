@@ -0,0 +1,118 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+A thread-safe front-end to the Memory class. A ShardedMemory divides the heap of a single RAM chip into a number of
+contiguous shards, each of which is managed by a Memory object of its own (with its own free list) and guarded by a lock
+of its own. Threads are assigned a 'home' shard the first time they allocate memory, so that threads working on
+different shards never wait for one another.
+"""
+
+from bisect import bisect_right
+from itertools import count
+import threading
+
+from .memory import Memory
+from .store import make_store
+
+
+class ShardedMemory:
+    """ Manages a RAM chip on behalf of many threads at once. The public interface mirrors that of Memory: alloc,
+    deAlloc, defrag and needs_repairs may all be called from any thread. """
+
+    def __init__(self, size, heap_ptr, shards=4, store="list", **options):
+        """ Creates an object that manages a RAM unit `size` registers large, whose heap is split into `shards` shards
+        of (as near as possible) equal size.
+
+        :param size: the total size of the ram chip managed by this object.
+        :param heap_ptr: an address specifying the point on the ram chip at which the heap starts.
+        :param shards: the number of shards, and therefore of independent free lists and locks.
+        :param store: the kind of register store used to model the ram chip (see Memory). Every kind of store can be
+        shared by the shards, as each shard only ever writes to its own registers (see store.py).
+        :param options: any further keyword arguments are passed on to the Memory object that manages each shard.
+        """
+        shard_size = (size - heap_ptr) // shards
+        if shard_size < 3:
+            raise ValueError("a heap of {} registers cannot be split into {} shards".format(size - heap_ptr, shards))
+
+        self._ram = make_store(store, size)
+        self._heap_ptr = heap_ptr
+        self._starts = [heap_ptr + i * shard_size for i in range(0, shards)]
+        ends = self._starts[1:] + [size]
+        self._shards = [Memory(size, start, store=self._ram, heap_end=end, **options)
+                        for (start, end) in zip(self._starts, ends)]
+        self._locks = [threading.Lock() for _ in range(0, shards)]
+        self._homes = threading.local()
+        self._next_home = count()
+
+    def alloc(self, size):
+        """ Allocates `size` registers, trying the calling thread's home shard first and each of the other shards in
+        turn if the home shard cannot service the request.
+
+        :param size: the size of the memory block required by the client.
+        :return: a pointer to the first register in the allocated memory, or None if no shard can meet the request.
+        """
+        home = self._home()
+        for offset in range(0, len(self._shards)):
+            index = (home + offset) % len(self._shards)
+            with self._locks[index]:
+                ptr = self._shards[index].alloc(size)
+            if ptr is not None:
+                return ptr
+        return None
+
+    def deAlloc(self, addr):
+        """ Releases a block of previously allocated memory, which may have been allocated by any thread. The block is
+        returned to the free list of the shard it came from.
+
+        :param addr: A memory address pointing to the start of a segment of previously allocated memory.
+        """
+        index = self.shard_of(addr)
+        with self._locks[index]:
+            self._shards[index].deAlloc(addr)
+
+    def defrag(self):
+        """ Defragments each shard in turn; only one shard is locked at any one time. """
+        for (lock, shard) in zip(self._locks, self._shards):
+            with lock:
+                shard.defrag()
+
+    def needs_repairs(self, fast=False):
+        """ Returns True if any shard needs repairs (see Memory.needs_repairs). """
+        for (lock, shard) in zip(self._locks, self._shards):
+            with lock:
+                if shard.needs_repairs(fast=fast):
+                    return True
+        return False
+
+    def shard_of(self, addr):
+        """ Returns the index of the shard that owns the register at `addr`. """
+        return bisect_right(self._starts, addr - 2) - 1
+
+    def _home(self):
+        """ Returns the index of the calling thread's home shard, assigning one (round-robin) if necessary. """
+        try:
+            return self._homes.index
+        except AttributeError:
+            self._homes.index = next(self._next_home) % len(self._shards)
+            return self._homes.index
+
+    @property
+    def shards(self):
+        """ The Memory objects that manage each shard. """
+        return list(self._shards)
+
+    @property
+    def heap_size(self):
+        """ The size of the heap section of the memory unit. """
+        return len(self._ram) - self.stack_size
+
+    @property
+    def stack_size(self):
+        """ The size of the stack section of the memory unit. """
+        return self._heap_ptr
+
+    def __str__(self):
+        """ A string representation of the contents of the entire memory unit. """
+        return str(self._shards[0])
@@ -0,0 +1,213 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+A Memory whose RAM chip lives in a block of shared memory (see multiprocessing.shared_memory), so that several processes
+can allocate from the same simulated chip without the chip ever being pickled or copied between them.
+
+The block holds a small header (the chip's size, heap pointer, the head of the free list and a generation counter that
+is bumped by every change to the chip) followed by the registers themselves, stored as in store.ArrayStore. Each process
+attached to the block keeps a Memory object of its own over the shared registers. Every alloc, deAlloc and defrag runs
+under a lock shared by all of the processes; if another process has changed the chip since this process last touched
+it, the local Memory object first rebuilds its tables from the chip (see Memory._reindex).
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+import os.path
+import tempfile
+import threading
+
+from .memory import Memory
+from .store import ArrayStore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = 0x4D454D4F5259  # 'MEMORY'
+HEADER_WORDS = 8
+_MAGIC, _SIZE, _HEAP_PTR, _FREE, _GENERATION = range(0, 5)
+
+_created = set()  # the names of the blocks created by this process
+
+
+def _open_block(name, registered=None):
+    """ Opens an existing shared memory block without registering it with this process's resource tracker, which would
+    otherwise destroy the block when this process exits (the creating process is responsible for unlinking it).
+
+    :param name: the name of the block.
+    :param registered: whether the block is already registered with the resource tracker used by this process (by
+    default, whether this process created the block). Processes started by multiprocessing share the resource tracker of
+    the process that started them.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name)
+        if not (block.name in _created if registered is None else registered):
+            resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+class FileLock:
+    """ A lock that can be shared by unrelated processes, based on an advisory lock (flock) on a file named after the
+    shared memory block. It also excludes other threads of the same process. """
+
+    def __init__(self, name):
+        if fcntl is None:
+            raise RuntimeError("file locks are not available on this platform; pass a multiprocessing.Lock instead")
+        self._path = os.path.join(tempfile.gettempdir(), "{}.lock".format(name))
+        self._file = open(self._path, "a")
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def close(self):
+        self._file.close()
+
+    def unlink(self):
+        """ Deletes the lock file; call once, when no process needs the lock any longer. """
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemory:
+    """ Manages a RAM chip held in shared memory on behalf of one process; other processes attach to the same chip with
+    SharedMemory.attach(name). The public interface mirrors that of Memory. """
+
+    def __init__(self, size, heap_ptr, name=None, lock=None, _block=None, **options):
+        """ Creates a new chip `size` registers large in a fresh block of shared memory.
+
+        :param size: the total size of the ram chip.
+        :param heap_ptr: an address specifying the point on the ram chip at which the heap starts.
+        :param name: the name of the shared memory block (a unique name is chosen if None).
+        :param lock: a lock shared by every process using the chip, such as a multiprocessing.Lock inherited from the
+        creating process. By default a FileLock named after the block is used, which needs no hand-over.
+        :param options: any further keyword arguments are passed on to Memory. Every process attached to a chip should
+        use the same options.
+        """
+        creating = _block is None
+        self._block = shared_memory.SharedMemory(name, create=True, size=(HEADER_WORDS + size) * 8) if creating \
+            else _block
+        self._words = self._block.buf.cast("q")
+        self._header = self._words[:HEADER_WORDS]
+        self._registers = self._words[HEADER_WORDS: HEADER_WORDS + size]
+        self._lock = FileLock(self._block.name) if lock is None else lock
+        self._owns_lock = lock is None
+
+        if creating:
+            _created.add(self._block.name)
+            store = ArrayStore(buffer=self._registers)
+            store.fill(0, size, None)  # A new block is zero-filled; registers start out uninitialised, as in any store
+            self._memory = Memory(size, heap_ptr, store=store, **options)
+            self._header[_SIZE] = size
+            self._header[_HEAP_PTR] = heap_ptr
+            self._header[_GENERATION] = 0
+            self._publish()
+            self._header[_MAGIC] = MAGIC
+        else:
+            with self._lock:  # Another process may be changing the chip
+                self._memory = Memory(size, heap_ptr, store=ArrayStore(buffer=self._registers),
+                                      free=self._header[_FREE], **options)
+                self._generation = self._header[_GENERATION]
+
+    @classmethod
+    def attach(cls, name, lock=None, **options):
+        """ Attaches to a chip created (by this or another process) with SharedMemory(..., name=name).
+
+        :param name: the name of the shared memory block.
+        :param lock: the lock shared by every process using the chip (see __init__).
+        :param options: any further keyword arguments are passed on to Memory.
+        """
+        block = _open_block(name)
+        header = block.buf.cast("q")
+        magic, size, heap_ptr = header[_MAGIC], header[_SIZE], header[_HEAP_PTR]
+        header.release()
+        if magic != MAGIC:
+            block.close()
+            raise ValueError("shared memory block '{}' does not hold a RAM chip".format(name))
+        return cls(size, heap_ptr, lock=lock, _block=block, **options)
+
+    @property
+    def name(self):
+        """ The name by which other processes can attach to the chip. """
+        return self._block.name
+
+    @property
+    def memory(self):
+        """ This process's Memory object. Its contents are only guaranteed to be current while the lock is held. """
+        return self._memory
+
+    def alloc(self, size):
+        """ See Memory.alloc. """
+        with self._lock:
+            self._sync()
+            ptr = self._memory.alloc(size)
+            self._publish()
+        return ptr
+
+    def deAlloc(self, addr):
+        """ See Memory.deAlloc. """
+        with self._lock:
+            self._sync()
+            self._memory.deAlloc(addr)
+            self._publish()
+
+    def defrag(self):
+        """ See Memory.defrag. """
+        with self._lock:
+            self._sync()
+            self._memory.defrag()
+            self._publish()
+
+    def needs_repairs(self, path=None):
+        """ See Memory.needs_repairs. """
+        with self._lock:
+            self._sync()
+            return self._memory.needs_repairs(path)
+
+    def status_report(self, path=None):
+        """ See Memory.status_report. Note that the log only covers the calls made by this process. """
+        with self._lock:
+            self._sync()
+            return self._memory.status_report(path)
+
+    def _sync(self):
+        """ Brings this process's Memory object up to date with any changes made to the chip by other processes. """
+        if self._header[_GENERATION] != self._generation:
+            self._memory._free = self._header[_FREE]
+            self._memory._reindex()
+            self._generation = self._header[_GENERATION]
+
+    def _publish(self):
+        """ Records the head of the free list in the shared header, and announces that the chip has changed. """
+        self._header[_FREE] = self._memory._free
+        self._header[_GENERATION] += 1
+        self._generation = self._header[_GENERATION]
+
+    def close(self):
+        """ Detaches this process from the chip (the chip itself survives until unlink is called). """
+        self._memory._ram.release()
+        for view in (self._registers, self._header, self._words):
+            view.release()
+        self._block.close()
+        if self._owns_lock:
+            self._lock.close()
+
+    def unlink(self):
+        """ Destroys the shared memory block (and the lock file that goes with it, unless a lock was supplied); call
+        once, from one process, when every process has finished with it. """
+        self._block.unlink()
+        if self._owns_lock:
+            self._lock.unlink()
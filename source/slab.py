@@ -0,0 +1,137 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+A slab cache for small, fixed-size allocations, layered on top of a Memory instance. Each size class is served from
+'slabs': segments allocated from the memory in the ordinary way and carved into a row of equal-sized slots. Requests for
+one of the cached sizes are met from a per-class pool of free slots, in constant time and without the two-register
+header that every segment carries; a new slab is only allocated when a class runs out of free slots, and a slab whose
+slots have all been released is handed straight back to the memory.
+"""
+
+from collections import namedtuple
+
+SlabStats = namedtuple("SlabStats", "hits misses slabs free_slots")
+
+
+class _Slab:
+    """ The book-keeping for a single slab: the size class it serves and the number of its slots in use. """
+
+    __slots__ = ("ptr", "size_class", "used")
+
+    def __init__(self, ptr, size_class):
+        self.ptr = ptr
+        self.size_class = size_class
+        self.used = 0
+
+
+class SlabCache:
+    """ Serves requests for small sizes from slabs, and passes every other request on to a Memory instance. """
+
+    def __init__(self, memory, sizes=(4, 8, 16), slots_per_slab=16):
+        """ Creates a slab cache in front of `memory`.
+
+        :param memory: the Memory instance from which slabs (and requests too large for any size class) are allocated.
+        :param sizes: the size classes, in registers. A request is served by the smallest class at least as large as it.
+        :param slots_per_slab: the number of slots carved from each slab.
+        """
+        self._memory = memory
+        self._sizes = sorted(sizes)
+        self._slots_per_slab = slots_per_slab
+        self._free = {size_class: {} for size_class in self._sizes}  # Free slots of each class (used as ordered sets)
+        self._slab_of = {}                                            # Slot address -> the _Slab it belongs to
+        self._slabs = {size_class: 0 for size_class in self._sizes}
+        self._hits = {size_class: 0 for size_class in self._sizes}
+        self._misses = {size_class: 0 for size_class in self._sizes}
+
+    @property
+    def memory(self):
+        """ The Memory instance behind the cache. """
+        return self._memory
+
+    def alloc(self, size):
+        """ Allocates `size` registers: from a slab if `size` fits one of the size classes, otherwise from the memory.
+
+        :param size: the size of the memory block required by the client.
+        :return: a pointer to the first register in the allocated memory, or None if the request cannot be met.
+        """
+        size_class = self._class_of(size)
+        if size_class is None:
+            return self._memory.alloc(size)
+
+        free = self._free[size_class]
+        if free:
+            self._hits[size_class] += 1
+        else:
+            self._misses[size_class] += 1
+            if not self._new_slab(size_class):
+                return None
+        ptr = free.popitem()[0]
+        self._slab_of[ptr].used += 1
+        return ptr
+
+    def deAlloc(self, addr):
+        """ Releases a block of previously allocated memory. If this empties the slab that the block came from, the slab
+        is returned to the memory.
+
+        :param addr: A memory address returned by alloc.
+        :raises ValueError: if `addr` is a slot that is already free, or otherwise does not point to allocated memory.
+        """
+        slab = self._slab_of.get(addr)
+        if slab is None:
+            self._memory.deAlloc(addr)
+            return
+
+        free = self._free[slab.size_class]
+        if addr in free:
+            raise ValueError("{} does not point to allocated memory".format(addr))
+        free[addr] = None
+        slab.used -= 1
+        if slab.used == 0:
+            self._release_slab(slab)
+
+    def _class_of(self, size):
+        """ Returns the smallest size class that can hold `size` registers, or None if `size` is too large. """
+        for size_class in self._sizes:
+            if size <= size_class:
+                return size_class
+        return None
+
+    def _new_slab(self, size_class):
+        """ Allocates a slab for `size_class` from the memory and adds its slots to the class's pool of free slots.
+
+        :return: True if the memory could provide a slab.
+        """
+        ptr = self._memory.alloc(size_class * self._slots_per_slab)
+        if ptr is None:
+            return False
+        slab = _Slab(ptr, size_class)
+        free = self._free[size_class]
+        for slot in reversed(range(ptr, ptr + size_class * self._slots_per_slab, size_class)):
+            free[slot] = None
+            self._slab_of[slot] = slab
+        self._slabs[size_class] += 1
+        return True
+
+    def _release_slab(self, slab):
+        """ Removes the (unused) slots of `slab` from the pool of free slots, and returns the slab to the memory. """
+        free = self._free[slab.size_class]
+        for slot in range(slab.ptr, slab.ptr + slab.size_class * self._slots_per_slab, slab.size_class):
+            del free[slot]
+            del self._slab_of[slot]
+        self._slabs[slab.size_class] -= 1
+        self._memory.deAlloc(slab.ptr)
+
+    @property
+    def stats(self):
+        """ A dict mapping each size class to a SlabStats namedtuple: the number of requests met from an existing free
+        slot (hits), the number that needed a new slab (misses), and the number of slabs and free slots currently held.
+        """
+        return {size_class: SlabStats(self._hits[size_class], self._misses[size_class], self._slabs[size_class],
+                                      len(self._free[size_class]))
+                for size_class in self._sizes}
+
+    def needs_repairs(self, path=None):
+        """ See Memory.needs_repairs. """
+        return self._memory.needs_repairs(path)
@@ -0,0 +1,310 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+Register stores for the Memory class. By default a Memory instance models its RAM chip as a plain Python list, which is
+easy to inspect but costs a pointer (and frequently a boxed integer) per register. The stores defined here trade a little
+per-access overhead for a compact, contiguous representation that scales to chips many millions of registers long.
+
+Every store behaves like a fixed-length list: it supports len(), iteration, and integer or slice indexing. Typed stores
+only know how to hold integers and the three 'marker' values that Memory writes into its registers (None, TICK and
+CROSS).
+
+Every store may be shared by threads that write to disjoint sets of registers, as the shards of a ShardedMemory do.
+Writes to the same registers from different threads must be serialised by the caller.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import threading
+
+TICK = "✔"
+CROSS = "✗"
+
+# Sentinel codes used to represent the non-integer register values in a typed store. They sit at the very bottom of the
+# signed 64-bit range, well clear of anything that Memory itself writes into a register (addresses, sizes, -1 and -100).
+NONE_CODE = -(2 ** 63)
+TICK_CODE = NONE_CODE + 1
+CROSS_CODE = NONE_CODE + 2
+
+_ENCODE = {None: NONE_CODE, TICK: TICK_CODE, CROSS: CROSS_CODE}
+_DECODE = {NONE_CODE: None, TICK_CODE: TICK, CROSS_CODE: CROSS}
+
+
+def encode(value):
+    """ Returns the 64-bit integer code used to store `value` in a typed register store.
+
+    :param value: an integer, None, TICK or CROSS.
+    :return: an integer suitable for storage in an array('q').
+    """
+    if isinstance(value, int):
+        if value <= CROSS_CODE:
+            raise ValueError("{} collides with a reserved register code".format(value))
+        return value
+    try:
+        return _ENCODE[value]
+    except (KeyError, TypeError):
+        raise TypeError("a typed register store cannot hold {!r}".format(value)) from None
+
+
+def decode(code):
+    """ The inverse of encode. """
+    return _DECODE.get(code, code)
+
+
+class ArrayStore:
+    """ A register store backed by a typed array of signed 64-bit integers (eight bytes per register).
+
+    Non-integer register values are stored as sentinel codes (see encode), and are translated back on the way out, so
+    that a Memory instance using this store behaves exactly as though its RAM chip were a list.
+    """
+
+    def __init__(self, size=0, buffer=None):
+        """ Creates a store `size` registers long; every register starts out uninitialised (None).
+
+        Alternatively, the store can be laid over an existing writable buffer of 64-bit codes - a memoryview with
+        format 'q' over a block of shared memory, for instance - in which case the buffer's contents are adopted as
+        they are, and `size` is ignored.
+
+        :param size: the number of registers in the store.
+        :param buffer: an existing buffer of register codes.
+        """
+        self._buf = array("q", [NONE_CODE]) * size if buffer is None else buffer
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __iter__(self):
+        return map(decode, self._buf)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(map(decode, self._buf[index]))
+        return decode(self._buf[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            codes = array("q", [encode(v) for v in value])
+            if len(codes) != len(range(*index.indices(len(self._buf)))):
+                raise ValueError("a register store cannot change size")
+            self._buf[index] = codes
+        else:
+            self._buf[index] = encode(value)
+
+    def fill(self, start, stop, value):
+        """ Writes `value` into every register from `start` up to (but not including) `stop`. """
+        self._buf[start:stop] = array("q", [encode(value)]) * (stop - start)
+
+    def codes(self, start, stop):
+        """ Returns the codes held in the registers from `start` up to (but not including) `stop`, as an array('q'). """
+        return array("q", self._buf[start:stop])
+
+    def release(self):
+        """ Lets go of the store's buffer, if it was supplied from outside (see __init__). The store cannot be used
+        afterwards. """
+        if isinstance(self._buf, memoryview):
+            self._buf.release()
+
+
+class PagedStore:
+    """ A sparse register store, divided into pages that are only materialised (as lists) when first written to.
+
+    Every page that has not been materialised holds a single implied value in all of its registers. The implied values
+    are kept as a map from runs of pages to values, so filling a long run of registers with a single value (as Memory
+    does when it lays out a heap, or marks a large segment) takes time proportional to the number of pages that were
+    already materialised in that run rather than to the number of registers. A new store therefore costs next to
+    nothing, however large, and its memory use follows the registers actually written rather than the size of the chip.
+    Like a list, a paged store can hold values of any kind.
+
+    Unlike the other stores, a paged store has book-keeping of its own that is shared by every register: the
+    materialised pages and the implied values. Materialising a page and changing the implied values are therefore done
+    under an internal lock, and the implied values are replaced as a whole rather than edited in place, so threads
+    working on different registers (including different registers of the same page) never disturb one another.
+    """
+
+    PAGE_SIZE = 4096  # The default number of registers in a page
+
+    def __init__(self, size=0, page_size=None):
+        """ Creates a store `size` registers long; every register starts out uninitialised (None).
+
+        :param size: the number of registers in the store.
+        :param page_size: the number of registers in each page (PAGE_SIZE by default).
+        """
+        self._size = size
+        self._page_size = self.PAGE_SIZE if page_size is None else page_size
+        self._pages = {}        # Page number -> list of register values, for the materialised pages
+        self._runs = ([0], [None])  # The first page of each run of pages that share an implied value, and the value
+        self._lock = threading.Lock()  # Held while materialising pages or changing the implied values
+
+    @property
+    def materialised_pages(self):
+        """ The number of pages that have been materialised. """
+        return len(self._pages)
+
+    def _default(self, page):
+        """ The implied value of the registers in `page`, if it has not been materialised. """
+        (bounds, defaults) = self._runs
+        return defaults[bisect_right(bounds, page) - 1]
+
+    def _page(self, page):
+        """ Returns the list of register values for `page`, materialising it if necessary. """
+        values = self._pages.get(page)
+        if values is None:
+            with self._lock:
+                values = self._pages.get(page)  # Another thread may have materialised the page in the meantime
+                if values is None:
+                    length = min(self._page_size, self._size - page * self._page_size)
+                    values = self._pages[page] = [self._default(page)] * length
+        return values
+
+    def _index(self, index):
+        """ Normalises an integer index, as a list would. """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("register store index out of range")
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for page in range(0, (self._size + self._page_size - 1) // self._page_size):
+            values = self._pages.get(page)
+            if values is None:
+                yield from [self._default(page)] * min(self._page_size, self._size - page * self._page_size)
+            else:
+                yield from values
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            page, offset = divmod(self._index(index), self._page_size)
+            values = self._pages.get(page)
+            return self._default(page) if values is None else values[offset]
+
+        (start, stop, step) = index.indices(self._size)
+        if step < 0:
+            return [self[i] for i in range(start, stop, step)]
+        result = []
+        while start < stop:
+            page, offset = divmod(start, self._page_size)
+            page_stop = min(stop, (page + 1) * self._page_size)
+            count = len(range(start, page_stop, step))
+            values = self._pages.get(page)
+            if values is None:
+                result += [self._default(page)] * count
+            else:
+                result += values[offset: page_stop - page * self._page_size: step]
+            start += count * step
+        return result
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, slice):
+            page, offset = divmod(self._index(index), self._page_size)
+            self._page(page)[offset] = value
+            return
+
+        value = list(value)
+        (start, stop, step) = index.indices(self._size)
+        if len(value) != len(range(start, stop, step)):
+            raise ValueError("a register store cannot change size")
+        if step != 1:
+            for (i, v) in zip(range(start, stop, step), value):
+                self[i] = v
+            return
+        position = 0
+        while start < stop:
+            page, offset = divmod(start, self._page_size)
+            page_stop = min(stop, (page + 1) * self._page_size)
+            self._page(page)[offset: page_stop - page * self._page_size] = value[position: position + page_stop - start]
+            position += page_stop - start
+            start = page_stop
+
+    def fill(self, start, stop, value):
+        """ Writes `value` into every register from `start` up to (but not including) `stop`. Whole pages are not
+        materialised; their implied value is changed instead. """
+        first_page = -(-start // self._page_size)
+        stop_page = -(-stop // self._page_size) if stop == self._size else stop // self._page_size  # (short last page)
+        if first_page >= stop_page:
+            self[start:stop] = [value] * (stop - start)
+            return
+
+        if start < first_page * self._page_size:
+            self[start: first_page * self._page_size] = [value] * (first_page * self._page_size - start)
+        if stop_page * self._page_size < stop:  # (never the case when the fill reaches a short last page)
+            self[stop_page * self._page_size: stop] = [value] * (stop - stop_page * self._page_size)
+        self._set_default(first_page, stop_page, value)
+
+    def _set_default(self, first_page, stop_page, value):
+        """ Sets the implied value of the pages from `first_page` up to (but not including) `stop_page`, discarding any
+        of them that have been materialised. """
+        with self._lock:
+            self._replace_default(first_page, stop_page, value)
+
+    def _replace_default(self, first_page, stop_page, value):
+        """ Does the work of _set_default (with the lock held). """
+        if stop_page - first_page < len(self._pages):
+            for page in range(first_page, stop_page):
+                self._pages.pop(page, None)
+        else:
+            for page in [page for page in self._pages if first_page <= page < stop_page]:
+                del self._pages[page]
+
+        # Replace every run boundary from first_page to stop_page with a run of `value` starting at first_page, followed
+        # (from stop_page) by whatever used to be implied at stop_page. Neighbouring runs with equal values are merged.
+        following = self._default(stop_page)
+        (bounds, defaults) = self._runs
+        low = bisect_left(bounds, first_page)
+        high = bisect_right(bounds, stop_page)
+        new_bounds, new_defaults = [], []
+        if low == 0 or defaults[low - 1] is not value:
+            new_bounds.append(first_page)
+            new_defaults.append(value)
+        if following is not value and stop_page * self._page_size < self._size:
+            new_bounds.append(stop_page)
+            new_defaults.append(following)
+        self._runs = (bounds[:low] + new_bounds + bounds[high:], defaults[:low] + new_defaults + defaults[high:])
+
+    def codes(self, start, stop):
+        """ Returns the codes (see encode) of the registers from `start` up to (but not including) `stop`, as an
+        array('q'). """
+        return array("q", map(encode, self[start:stop]))
+
+
+def fill(store, start, stop, value):
+    """ Writes `value` into every register of `store` from `start` up to (but not including) `stop` in a single bulk
+    operation.
+
+    :param store: a list, or one of the stores defined in this module.
+    """
+    if type(store) is list:
+        store[start:stop] = [value] * (stop - start)
+    else:
+        store.fill(start, stop, value)
+
+
+def codes(store, start, stop):
+    """ Returns the registers of `store` from `start` up to (but not including) `stop`, encoded (see encode) as an
+    array('q').
+
+    :param store: a list, or one of the stores defined in this module.
+    """
+    if type(store) is list:
+        return array("q", map(encode, store[start:stop]))
+    return store.codes(start, stop)
+
+
+def make_store(kind, size):
+    """ Returns a new register store `size` registers long, with every register set to None.
+
+    :param kind: the name of the store required: 'list' (the default used by Memory), 'array' or 'paged'.
+    :param size: the number of registers in the store.
+    """
+    if kind == "list":
+        return [None] * size
+    if kind == "array":
+        return ArrayStore(size)
+    if kind == "paged":
+        return PagedStore(size)
+    raise ValueError("unknown register store '{}'".format(kind))
@@ -0,0 +1,85 @@
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+"""
+Segment views: windows onto the data-registers of an allocated segment that read and write the RAM chip directly,
+rather than copying registers out (as Memory._read_segment does) and back in again (as Memory._write_segment does).
+Views are obtained with Memory.view(addr).
+
+A view behaves much like a memoryview of fixed length: it supports len(), iteration, and integer or slice indexing and
+assignment, but can never reach beyond its segment, and a slice assignment must not change its length. A view goes stale
+as soon as its segment is released, resized or moved; any further use of it raises ValueError.
+"""
+
+
+class SegmentView:
+    """ A bounds-checked, writable view of the data-registers of an allocated segment. """
+
+    __slots__ = ("_memory", "_seg_base", "_start", "_length", "_epoch")
+
+    def __init__(self, memory, seg_base):
+        """ Creates a view of the allocated segment at `seg_base`; use Memory.view rather than calling this directly.
+
+        :param memory: the Memory instance that manages the segment.
+        :param seg_base: an address pointing to the start of an allocated memory segment.
+        """
+        self._memory = memory
+        self._seg_base = seg_base
+        self._start = seg_base + 2
+        self._length = memory._ram[seg_base + 1] - 2
+        self._epoch = memory._epochs.setdefault(seg_base, 0)
+
+    @property
+    def valid(self):
+        """ False once the segment has been released, resized or moved. """
+        return self._memory._epochs[self._seg_base] == self._epoch
+
+    def _check(self):
+        """ Raises ValueError if the view has gone stale. """
+        if not self.valid:
+            raise ValueError("the segment at {} has been released, resized or moved".format(self._seg_base))
+
+    def _address(self, index):
+        """ Returns the address of the register at position `index` in the view. """
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("segment view index out of range")
+        return self._start + index
+
+    def _range(self, index):
+        """ Returns the slice of the RAM chip covered by the slice `index` of the view, and its length. """
+        (start, stop, step) = index.indices(self._length)
+        return slice(self._start + start, self._start + stop, step), len(range(start, stop, step))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        self._check()
+        return iter(self._memory._ram[self._start: self._start + self._length])
+
+    def __getitem__(self, index):
+        self._check()
+        if isinstance(index, slice):
+            return self._memory._ram[self._range(index)[0]]
+        return self._memory._ram[self._address(index)]
+
+    def __setitem__(self, index, value):
+        self._check()
+        if isinstance(index, slice):
+            registers, length = self._range(index)
+            value = list(value)
+            if len(value) != length:
+                raise ValueError("a segment view cannot change size")
+            self._memory._ram[registers] = value
+        else:
+            self._memory._ram[self._address(index)] = value
+
+    def tolist(self):
+        """ Returns a copy of the registers in the view, as a list. """
+        return list(self)
+
+    def __repr__(self):
+        return "<SegmentView of {} registers at {}{}>".format(self._length, self._start, "" if self.valid else " (stale)")
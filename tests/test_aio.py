@@ -0,0 +1,119 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with aio.py """
+
+import sys
+import os.path
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from source.memory import Alloc, Dealloc, Memory
+from source.aio import AsyncMemory
+
+
+class TestAsyncMemory(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up an AsyncMemory in front of a coalescing memory with a 59 register heap, and at most 3 waiters. """
+        self.memory = AsyncMemory(Memory(size=64, heap_ptr=5, coalesce=True), max_waiters=3)
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_immediate_alloc(self):
+        """ A request that can be met straight away does not wait. """
+        self.assertEqual(self.run_async(self.memory.alloc(15)), 49)
+        self.assertEqual(self.memory.waiting, 0)
+
+    def test_waits_for_dealloc(self):
+        """ A request that cannot be met waits until enough memory has been released. """
+        async def scenario():
+            big = await self.memory.alloc(50)
+            waiter = asyncio.ensure_future(self.memory.alloc(20))
+            await asyncio.sleep(0)
+            self.assertEqual(self.memory.waiting, 1)
+            self.assertFalse(waiter.done())
+            self.memory.deAlloc(big)
+            return await waiter
+        self.assertEqual(self.run_async(scenario()), 44)
+        self.assertFalse(self.memory.memory.needs_repairs())
+
+    def test_fifo_order(self):
+        """ Waiting requests are met in order of arrival; a large request holds up the small ones behind it. """
+        async def scenario():
+            ptrs = [await self.memory.alloc(size) for size in (20, 20, 10)]
+            served = []
+
+            async def request(size):
+                ptr = await self.memory.alloc(size)
+                served.append(size)
+                return ptr
+
+            waiters = [asyncio.ensure_future(request(size)) for size in (30, 3, 4)]
+            await asyncio.sleep(0)
+            self.memory.deAlloc(ptrs[2])  # Enough for the small requests, but not for the first
+            await asyncio.sleep(0)
+            self.assertEqual(served, [])
+            self.memory.dealloc_many(ptrs[:2])
+            await asyncio.gather(*waiters)
+            return served
+        self.assertEqual(self.run_async(scenario()), [30, 3, 4])
+        self.assertFalse(self.memory.memory.needs_repairs())
+
+    def test_blocked_head_leaves_heap_alone(self):
+        """ While the request at the head of the queue cannot be met, the requests behind it allocate nothing, even if
+        there is room for them: the heap and the log are left exactly as they were. """
+        memory = AsyncMemory(Memory(size=64, heap_ptr=5))
+
+        async def scenario():
+            ptrs = [await memory.alloc(size) for size in (13, 5, 13, 20)]
+            waiters = [asyncio.ensure_future(memory.alloc(size)) for size in (20, 3)]
+            await asyncio.sleep(0)
+            memory.deAlloc(ptrs[0])
+            log_count = memory.memory._log_count
+            memory.deAlloc(ptrs[2])  # Two free segments of 15 registers: too small for the head, but not for the 3
+            await asyncio.sleep(0)
+            self.assertEqual([memory.memory._ram[seg_base + 1] for seg_base in memory.memory._free_list], [15, 15])
+            self.assertEqual(list(memory.memory._log)[log_count:], [Dealloc(ptrs[2]), Alloc(20, -1)])
+            self.assertEqual(memory.waiting, 2)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+        self.run_async(scenario())
+
+    def test_bounded_queue(self):
+        """ Requests beyond max_waiters fail at once. """
+        async def scenario():
+            await self.memory.alloc(57)
+            waiters = [asyncio.ensure_future(self.memory.alloc(1)) for _ in range(0, 3)]
+            await asyncio.sleep(0)
+            with self.assertRaises(asyncio.QueueFull):
+                await self.memory.alloc(1)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            self.assertEqual(self.memory.waiting, 0)
+        self.run_async(scenario())
+
+    def test_timeout(self):
+        """ A request that times out leaves the queue, and stops holding up the requests behind it. """
+        async def scenario():
+            await self.memory.alloc(40)
+            first = asyncio.ensure_future(self.memory.alloc(30, timeout=0.01))
+            second = asyncio.ensure_future(self.memory.alloc(5))
+            await asyncio.sleep(0)
+            self.assertEqual(self.memory.waiting, 2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await first
+            return await second
+        self.assertEqual(self.run_async(scenario()), 17)
+        self.assertEqual(self.memory.waiting, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
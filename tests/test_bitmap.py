@@ -0,0 +1,66 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with bitmap.py """
+
+import sys
+import os.path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import random
+from source.bitmap import Bitmap
+
+
+class TestBitmap(unittest.TestCase):
+
+    def test_set_operations(self):
+        """ A bitmap behaves like a set of addresses, iterated in ascending order. """
+        bitmap = Bitmap([130, 5, 64, 63])
+        self.assertEqual(list(bitmap), [5, 63, 64, 130])
+        self.assertEqual(len(bitmap), 4)
+        self.assertIn(64, bitmap)
+        self.assertNotIn(65, bitmap)
+        bitmap.add(5)
+        bitmap.remove(64)
+        self.assertEqual((list(bitmap), len(bitmap)), ([5, 63, 130], 3))
+        with self.assertRaises(KeyError):
+            bitmap.remove(64)
+
+    def test_next_set(self):
+        """ next_set finds the next address in the set within a range. """
+        bitmap = Bitmap([3, 64, 10 ** 9])
+        self.assertEqual(bitmap.next_set(0, 100), 3)
+        self.assertEqual(bitmap.next_set(3, 100), 3)
+        self.assertEqual(bitmap.next_set(4, 100), 64)
+        self.assertIsNone(bitmap.next_set(4, 64))
+        self.assertEqual(bitmap.next_set(65, 10 ** 10), 10 ** 9)
+        self.assertIsNone(bitmap.next_set(10 ** 9 + 1, 10 ** 10))
+
+    def test_next_set_after_changes(self):
+        """ Long jumps between sparse words still find addresses added or removed since the previous search. """
+        bitmap = Bitmap([0, 10 ** 6])
+        self.assertEqual(bitmap.next_set(1, 10 ** 7), 10 ** 6)
+        bitmap.add(5000)
+        self.assertEqual(bitmap.next_set(1, 10 ** 7), 5000)
+        bitmap.remove(5000)
+        bitmap.remove(10 ** 6)
+        self.assertIsNone(bitmap.next_set(1, 10 ** 7))
+
+    def test_random(self):
+        """ next_set agrees with a plain set of addresses. """
+        rng = random.Random(23)
+        addresses = set(rng.sample(range(0, 5000), 200))
+        bitmap = Bitmap(addresses)
+        for _ in range(0, 500):
+            start = rng.randrange(0, 5000)
+            stop = rng.randrange(start, 5001)
+            candidates = [address for address in addresses if start <= address < stop]
+            self.assertEqual(bitmap.next_set(start, stop), min(candidates) if candidates else None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with buddy.py """
+
+import sys
+import os.path
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import random
+from pathlib import Path
+from source.buddy import BuddyMemory
+
+
+class TestBuddyMemory(unittest.TestCase):
+
+    store = "list"
+
+    def setUp(self):
+        """ Sets up a BuddyMemory object which will manage a ram-chip 64 registers long (a 56 register heap). """
+        self.memory = BuddyMemory(size=64, heap_ptr=5, store=self.store)
+
+    def block_sizes(self):
+        """ The (base address, size) of every free block, in address order. """
+        return sorted((seg_base, self.memory._peek(seg_base + 1)) for seg_base in self.memory._free_list)
+
+    def test_startup(self):
+        """ The heap is laid out as a row of power-of-two blocks, largest first. """
+        self.assertEqual(self.memory.heap_size, 56)
+        self.assertEqual(self.block_sizes(), [(5, 32), (37, 16), (53, 8)])
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_split(self):
+        """ The smallest block that fits is halved until it is just big enough. """
+        self.assertEqual(self.memory.alloc(1), 55)
+        self.assertEqual(self.memory._peek(54), 4)
+        self.assertEqual(self.memory.alloc(6), 39)
+        self.assertEqual(self.block_sizes(), [(5, 32), (45, 8), (57, 4)])
+        self.assertEqual(self.memory.alloc(30), 7)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_merge(self):
+        """ A released block is merged with its buddy, and the result with its own buddy, and so on. """
+        ptrs = [self.memory.alloc(size) for size in (2, 2, 2, 6)]
+        self.assertEqual(ptrs, [55, 59, 39, 47])
+        self.memory.deAlloc(59)
+        self.memory.deAlloc(47)
+        self.assertEqual(self.block_sizes(), [(5, 32), (41, 4), (45, 8), (57, 4)])
+        self.memory.deAlloc(55)
+        self.memory.deAlloc(39)
+        self.assertEqual(self.block_sizes(), [(5, 32), (37, 16), (53, 8)])
+        self.assertFalse(self.memory.needs_repairs())
+        self.assertTrue(self.memory.status_report().endswith("37 -> 53 -> 5"))
+
+    def test_realloc(self):
+        """ A block is only resized in place if it stays the same size; otherwise it moves. """
+        ptr = self.memory.alloc(3)
+        self.assertEqual(self.memory.realloc(ptr, 6), (ptr, False))
+        new_ptr, copied = self.memory.realloc(ptr, 7)
+        self.assertTrue(copied)
+        self.assertEqual(self.memory._peek(new_ptr - 1), 16)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_compact(self):
+        """ Compacting the heap leaves it as it was, and reports that nothing has moved. """
+        ptrs = [self.memory.alloc(size) for size in (2, 2, 2, 6)]
+        self.memory.deAlloc(ptrs[0])
+        blocks = self.block_sizes()
+        self.assertEqual(self.memory.compact(), (0, 0, len(blocks), 0.0))
+        self.assertEqual(self.block_sizes(), blocks)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_too_big(self):
+        """ Requests larger than the largest free block fail. """
+        self.assertIsNone(self.memory.alloc(31))
+        self.assertIn("alloc(31) -> -1", self.memory.log)
+
+    def test_random_alloc_dealloc(self):
+        """ Random allocations and deallocations leave the heap healthy, and releasing everything restores it. """
+        rng = random.Random(14)
+        live = []
+        for _ in range(0, 500):
+            if live and rng.random() < 0.5:
+                self.memory.deAlloc(live.pop(rng.randrange(len(live))))
+            else:
+                ptr = self.memory.alloc(rng.randint(1, 12))
+                if ptr is not None:
+                    live.append(ptr)
+            self.assertFalse(self.memory.needs_repairs(fast=True))
+        self.assertFalse(self.memory.needs_repairs())
+        self.memory.dealloc_many(live)
+        self.assertEqual(self.block_sizes(), [(5, 32), (37, 16), (53, 8)])
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_save_and_load(self):
+        """ A snapshot of a buddy memory is restored as a buddy memory. """
+        ptr = self.memory.alloc(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "chip.snapshot"
+            self.memory.save(path)
+            restored = BuddyMemory.load(path)
+            restored.deAlloc(ptr)
+            self.assertEqual(sorted(restored._free_list), [5, 37, 53])
+            self.assertFalse(restored.needs_repairs())
+            restored._ram.release()
+
+
+class TestBuddyMemoryArrayStore(TestBuddyMemory):
+
+    store = "array"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,16 +13,24 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 import unittest
 import random
+import time
+import io
+import tempfile
+from unittest import mock
 from source.memory import Memory
+from source.store import PagedStore
 from pathlib import Path
 
 LOG_PATH = Path(os.path.dirname(__file__)) / "log.txt"
 
 class TestMemory(unittest.TestCase):
 
+    store = "list"
+    policy = "first-fit"
+
     def setUp(self):
         """ Sets up a Memory object which will manage a ram-chip 64 registers long. """
-        self.memory = Memory(size=64, heap_ptr=5)
+        self.memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy)
 
     def write_memory_log(self):
         with open(LOG_PATH.as_posix(), "w") as lf:
@@ -61,6 +69,20 @@ class TestMemory(unittest.TestCase):
         """ Requesting allocation of a chunk of memory that exceeds the size of the ram-chip. """
         self.assertIsNone(self.memory.alloc(65))
 
+    def test_invalid_dealloc(self):
+        """ Releasing a bogus pointer, or releasing memory twice, is refused and leaves the chip untouched. """
+        ptr = self.memory.alloc(15)
+        for addr in (ptr + 1, 7, 0):
+            with self.assertRaises(ValueError):
+                self.memory.deAlloc(addr)
+        self.memory.deAlloc(ptr)
+        with self.assertRaises(ValueError):
+            self.memory.deAlloc(ptr)
+        with self.assertRaises(ValueError):
+            self.memory.dealloc_many([self.memory.alloc(3), ptr])  # The first address is released before the second fails
+        self.assertEqual(len(self.memory._free_list), 3)
+        self.assertFalse(self.memory.needs_repairs())
+
     def test_read_segment(self):
         """ Reading the contents of a specific part of the ram-chip """
         ptr = self.memory.alloc(15)
@@ -82,7 +104,333 @@ class TestMemory(unittest.TestCase):
         self.assertEqual(len(self.memory._free_list), 0)
         self.assertEqual(self.memory._free, -1)
 
-    def memory_with_string(self, memory_string):
+    # Batches
+
+    def test_alloc_many(self):
+        """ alloc_many returns the same pointers, and leaves the same chip and log, as a sequence of alloc calls. """
+        layout = "NNNNN -100 7 ✗ ✗ ✗ ✗ ✗ -1 8 ✔ ✔ ✔ ✔ ✔ ✔ -100 5 ✗ ✗ ✗ 12 7 ✔ ✔ ✔ ✔ ✔"
+        for _ in range(50):
+            sizes = [random.randrange(1, 7) for _ in range(6)]
+            batched, sequential = self.memory_with_string(layout), self.memory_with_string(layout)
+            self.assertEqual(batched.alloc_many(sizes), [sequential.alloc(size) for size in sizes])
+            self.assertEqual("{:short}".format(batched), "{:short}".format(sequential))
+            self.assertEqual(batched.log, sequential.log)
+            self.assertFalse(batched.needs_repairs())
+
+    def test_dealloc_many(self):
+        """ dealloc_many has the same effect as a sequence of deAlloc calls. """
+        batched = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy)
+        sequential = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy)
+        ptrs = batched.alloc_many([3, 8, 2, 5, 4])
+        self.assertEqual(ptrs, [sequential.alloc(size) for size in [3, 8, 2, 5, 4]])
+        batched.dealloc_many(ptrs[1::2])
+        for ptr in ptrs[1::2]:
+            sequential.deAlloc(ptr)
+        self.assertEqual("{:short}".format(batched), "{:short}".format(sequential))
+        self.assertEqual(batched.log, sequential.log)
+        self.assertEqual(batched._free_list, [38, 49, 5])
+
+    # Health checks
+
+    def test_fast_health_check(self):
+        """ The constant-time health check agrees with the full check on a healthy chip, and spots bad counters. """
+        allocated = []
+        for _ in range(200):
+            if allocated and random.random() < 0.4:
+                self.memory.deAlloc(allocated.pop(random.randrange(0, len(allocated))))
+            else:
+                ptr = self.memory.alloc(random.randrange(1, 8))
+                if ptr is not None:
+                    allocated.append(ptr)
+            if random.random() < 0.05:
+                self.memory.defrag()
+            self.assertFalse(self.memory.needs_repairs(fast=True))
+        self.assertFalse(self.memory.needs_repairs())
+        self.memory._free_registers += 1
+        self.assertTrue(self.memory.needs_repairs(fast=True))
+        self.assertTrue(self.memory.needs_repairs())
+
+    def test_fast_check_spots_bad_header(self):
+        """ The constant-time health check examines the header of the segment most recently touched. """
+        ptr = self.memory.alloc(10)
+        self.memory._poke(ptr - 2, 7)
+        self.assertTrue(self.memory.needs_repairs(fast=True))
+
+    def test_deep_verify_every(self):
+        """ With deep_verify_every=N, every Nth fast check runs the full checks. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, deep_verify_every=3)
+        memory.alloc(10)
+        memory._poke(20, 3)  # A malformed segment header in the middle of the free segment, missed by the fast check
+        self.assertEqual([memory.needs_repairs(fast=True) for _ in range(6)], [False, False, True] * 2)
+
+    # Reports
+
+    def test_write_report(self):
+        """ Streaming a report to a file, a few registers at a time, produces exactly the report status_report returns.
+        """
+        memory = self.memory_with_string("NNNNN -100 7 ✗ ✗ ✗ ✗ ✗ -1 8 ✔ ✔ ✔ ✔ ✔ ✔ -100 5 ✗ ✗ ✗ 12 7 ✔ ✔ ✔ ✔ ✔")
+        memory.REPORT_CHUNK = 1
+        report_file = io.StringIO()
+        memory.write_report(report_file)
+        self.assertEqual(report_file.getvalue(), memory.status_report())
+        self.assertEqual(str(memory).count("\n"), 15)
+
+    def test_report_free_list_chunks(self):
+        """ The free list is reported as a single chain, however it is divided into chunks. """
+        memory = self.memory_with_string("NNNNN -100 7 ✗ ✗ ✗ ✗ ✗ -1 8 ✔ ✔ ✔ ✔ ✔ ✔ -100 5 ✗ ✗ ✗ 12 7 ✔ ✔ ✔ ✔ ✔")
+        expected = "FREE LIST\n{}\n{}".format("-" * 45, " -> ".join(str(i) for i in memory._free_list))
+        for chunk in (1, 2, 3):
+            memory.REPORT_CHUNK = chunk
+            report_file = io.StringIO()
+            memory.write_report(report_file)
+            self.assertTrue(report_file.getvalue().endswith(expected), chunk)
+
+    def test_run_length_report(self):
+        """ A run-length encoded report lists each run of identical registers on a single line. """
+        memory = self.memory_with_string("NNNNN -100 7 ✗ ✗ ✗ ✗ ✗ -1 8 ✔ ✔ ✔ ✔ ✔ ✔ -100 5 ✗ ✗ ✗ 12 7 ✔ ✔ ✔ ✔ ✔")
+        memory.REPORT_CHUNK = 4
+        report_file = io.StringIO()
+        memory.write_report(report_file, run_length=True)
+        report = report_file.getvalue()
+        self.assertIn("\n0-4              None      (5)\n5                -100      (1)\n", report)
+        self.assertIn("\n14-19            ✔         (6)\n", report)
+        self.assertIn("\n27-31            ✔         (5)\n\n\nALLOCATIONS LOG", report)
+        self.assertTrue(report.endswith("FREE LIST\n{}\n25 -> 12".format("-" * 45)))
+
+    # Markers
+
+    def test_no_markers(self):
+        """ With markers=False data-registers are never filled, and the chip's health is judged by walking the heap. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, markers=False)
+        self.assertIsNone(memory._peek(7))
+        a, b, c = memory.alloc(10), memory.alloc(4), memory.alloc(6)
+        memory._write_segment(b - 2, 9)
+        self.assertEqual(memory._read_segment(b - 2), [9] * 4)
+        memory.deAlloc(b)
+        memory.deAlloc(a)
+        memory.defrag()
+        self.assertEqual([memory._peek(i) for i in range(b, b + 4)], [9] * 4)
+        self.assertEqual(memory._free_list, [5, 46])
+        self.assertEqual(memory._peek(47), 18)
+        self.assertFalse(memory.needs_repairs())
+        memory._poke(47, 19)
+        self.assertTrue(memory.needs_repairs())
+
+    # Logging
+
+    def test_log(self):
+        """ The log lists every call, most recent first. """
+        ptr = self.memory.alloc(15)
+        self.memory.deAlloc(ptr)
+        self.memory.alloc(65)
+        self.assertEqual(self.memory.log, "ALLOCATIONS LOG\n---------------\n"
+                                          "3.\t\talloc(65) -> -1\n2.\t\tdeAlloc(49)\n1.\t\talloc(15) -> 49\n")
+
+    def test_bounded_log(self):
+        """ A memory with a log_capacity only remembers its most recent calls, but numbers them correctly. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, log_capacity=2)
+        for size in (3, 4, 5):
+            memory.alloc(size)
+        self.assertEqual(memory.log, "ALLOCATIONS LOG\n---------------\n"
+                                     "3.\t\talloc(5) -> 48\n2.\t\talloc(4) -> 55\n")
+
+    def test_logging_off(self):
+        """ log_capacity=0 turns logging off. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, log_capacity=0)
+        memory.deAlloc(memory.alloc(3))
+        self.assertIsNone(memory._log)
+        self.assertTrue(memory.log.endswith("(logging is turned off)\n"))
+        self.assertFalse(memory.needs_repairs())
+
+    def test_metrics(self):
+        """ The metrics follow every alloc, deAlloc and defrag. """
+        metrics = self.memory.metrics
+        self.assertEqual((metrics.free_segments, metrics.free_registers, metrics.largest_free), (1, 59, 59))
+        self.assertEqual((metrics.fragmentation, metrics.allocs, metrics.walked_per_alloc), (0.0, 0, 0.0))
+        ptrs = [self.memory.alloc(size) for size in (10, 10, 10)]
+        self.memory.deAlloc(ptrs[1])
+        self.memory.alloc(10)
+        self.memory.alloc(60)
+        metrics = self.memory.metrics
+        self.assertEqual((metrics.allocs, metrics.splits + metrics.whole_segments), (4, 4))
+        self.assertEqual((metrics.failures, metrics.deallocs, metrics.free_registers), (1, 1, 23))
+        self.assertGreater(metrics.walked_per_alloc, 0)
+        self.memory.deAlloc(ptrs[0])
+        self.memory.deAlloc(ptrs[2])
+        for _ in range(0, 2):
+            sizes = [self.memory._peek(seg_base + 1) for seg_base in self.memory._free_list]
+            metrics = self.memory.metrics
+            self.assertEqual((metrics.free_segments, metrics.free_registers), (len(sizes), sum(sizes)))
+            self.assertEqual(metrics.largest_free, max(sizes))
+            self.assertAlmostEqual(metrics.fragmentation, 1 - max(sizes) / sum(sizes))
+            self.memory.defrag()
+        self.assertGreater(metrics.defrag_seconds, 0)
+
+    def test_impossible_alloc_fails_at_once(self):
+        """ A request larger than every free segment fails without the free list being walked. """
+        ptrs = [self.memory.alloc(3) for _ in range(0, 11)]
+        for ptr in ptrs[::2]:
+            self.memory.deAlloc(ptr)
+        walked = self.memory._walked
+        self.assertIsNone(self.memory.alloc(4))
+        self.assertEqual(self.memory._walked, walked)
+        self.assertEqual(self.memory._sizes, [4, 5])
+        self.memory.deAlloc(ptrs[1])
+        self.assertEqual(self.memory._sizes, [4, 5])
+        self.memory.defrag()
+        self.assertEqual(self.memory._sizes, [5, 9, 15])
+        self.assertIsNotNone(self.memory.alloc(12))
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_compact(self):
+        """ Segments allocated through handles slide towards the start of the heap; pinned segments stay put. """
+        handles = [self.memory.alloc_handle(3) for _ in range(0, 5)]
+        pinned = self.memory.alloc(4)
+        handles += [self.memory.alloc_handle(6) for _ in range(0, 3)]
+        self.memory._write_segment(self.memory.address(handles[1]) - 2, None)
+        for handle in handles[::2]:
+            self.memory.free_handle(handle)
+        self.assertIsNone(self.memory.alloc(20))
+
+        report = self.memory.compact()
+        self.assertEqual((report.segments_moved, report.registers_moved, report.free_segments), (4, 26, 2))
+        self.assertEqual(self.memory._free_list, [21, 49])
+        self.assertEqual(self.memory._peek(pinned), "✗")
+        self.assertEqual([self.memory.address(handle) for handle in handles[1::2]], [46, 41, 15, 7])
+        self.assertEqual(self.memory._read_segment(44), [None] * 3)
+        self.assertFalse(self.memory.needs_repairs())
+
+        self.memory.deAlloc(pinned)
+        report = self.memory.compact()
+        self.assertEqual((report.segments_moved, report.free_segments), (2, 1))
+        self.assertEqual(self.memory._free_list, [31])
+        self.assertIsNotNone(self.memory.alloc(20))
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_handle_memory_not_released_by_deAlloc(self):
+        """ Memory allocated through a handle can only be released with free_handle, so that compact never moves a
+        pinned segment that later takes its place. """
+        first = self.memory.alloc(10)
+        handle = self.memory.alloc_handle(5)
+        addr = self.memory.address(handle)
+        with self.assertRaises(ValueError):
+            self.memory.deAlloc(addr)
+        with self.assertRaises(ValueError):
+            self.memory.dealloc_many([addr])
+        self.assertEqual(self.memory.address(handle), addr)
+        self.memory.free_handle(handle)
+        self.memory.deAlloc(first)
+        pinned = self.memory.alloc(5)
+        self.memory.compact()
+        self.assertEqual(self.memory._peek(pinned), "✗")
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_realloc_in_place(self):
+        """ Blocks shrink by releasing their tails, and grow into a free segment that follows them. """
+        self.memory.alloc(10)
+        ptr = self.memory.alloc(5)
+        self.assertEqual(self.memory.realloc(ptr, 2), (ptr, False))
+        self.assertEqual(self.memory._peek(ptr - 1), 4)
+        self.assertIn(ptr + 2, self.memory._free_list)
+        self.assertFalse(self.memory.needs_repairs())
+        self.assertEqual(self.memory.realloc(ptr, 5), (ptr, False))
+        self.assertEqual(self.memory._peek(ptr - 1), 7)
+        self.assertEqual(self.memory._free_list, [5])
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_realloc_moves_when_necessary(self):
+        """ A block that cannot grow in place is copied to a new block; if there is none, it is left alone. """
+        ptr = self.memory.alloc(10)
+        self.memory._write_segment(ptr - 2, None)
+        new_ptr, copied = self.memory.realloc(ptr, 15)
+        self.assertTrue(copied)
+        self.assertEqual(self.memory._read_segment(new_ptr - 2), [None] * 10 + ["✗"] * 5)
+        self.assertIn(ptr - 2, self.memory._free_list)
+        self.assertEqual(self.memory.realloc(new_ptr, 100), (None, False))
+        self.assertEqual(self.memory._peek(new_ptr - 1), 17)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_realloc_grow_under_defrag_cursor(self):
+        """ Growing a block over the free segment that defrag_step is due to visit next leaves the cursor on a segment
+        boundary. """
+        a, b, c, d = [self.memory.alloc(5) for _ in range(0, 4)]
+        self.memory.deAlloc(c)
+        self.memory.defrag_step(2)
+        self.assertEqual(self.memory._defrag_cursor, c - 2)
+        self.assertEqual(self.memory.realloc(d, 10), (d, False))
+        self.assertEqual(self.memory._defrag_cursor, d - 2)
+        self.memory.defrag_step(10)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_hooks(self):
+        """ Hooks see every alloc and deAlloc call, batched or not, until they are removed. """
+        calls = []
+        hook = lambda entry, elapsed: calls.append(entry)
+        self.memory.add_hook(hook)
+        ptr = self.memory.alloc(5)
+        self.memory.deAlloc(ptr)
+        batch = self.memory.alloc_many([3, 100])
+        self.memory.dealloc_many(batch[:1])
+        self.memory.remove_hook(hook)
+        self.memory.alloc(4)
+        self.assertEqual(calls, [(5, ptr), (ptr,), (3, batch[0]), (100, -1), (batch[0],)])
+
+    def test_save_and_load(self):
+        """ A memory restored from a snapshot matches the original, and carries on exactly as the original would. """
+        ptrs = [self.memory.alloc(size) for size in (7, 3, 12, 5)]
+        self.memory.deAlloc(ptrs[1])
+        self.memory.alloc(80)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "chip.snapshot"
+            self.memory.save(path)
+            restored = Memory.load(path, policy=self.policy)
+            self.assertEqual(str(restored), str(self.memory))
+            self.assertEqual(restored.log, self.memory.log)
+            self.assertEqual(restored._free_list, self.memory._free_list)
+            self.assertFalse(restored.needs_repairs())
+            for size in (4, 1, 9):
+                self.assertEqual(restored.alloc(size), self.memory.alloc(size))
+            restored.deAlloc(ptrs[0])
+            self.assertEqual(Memory.load(path)._free_list, [ptrs[1] - 2, 5])
+            restored._ram.release()
+
+    def test_load_rejects_other_files(self):
+        """ Loading a file that is not a snapshot fails. """
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "report.txt"
+            self.memory.status_report(path)
+            with self.assertRaises(ValueError):
+                Memory.load(path)
+
+    def test_save_unsaveable_registers(self):
+        """ A memory holding a value that cannot be saved leaves any existing snapshot untouched. """
+        if self.store == "array":
+            self.skipTest("typed stores cannot hold such values in the first place")
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "chip.snapshot"
+            self.memory.save(path)
+            saved = path.read_bytes()
+            ptr = self.memory.alloc(4)
+            for value in ("a", 2 ** 63):
+                self.memory._write_segment(ptr - 2, value)
+                with self.assertRaises((TypeError, ValueError, OverflowError)):
+                    self.memory.save(path)
+                self.assertEqual(path.read_bytes(), saved)
+                self.assertEqual(os.listdir(directory), ["chip.snapshot"])
+
+    def test_load_rejects_truncated_snapshots(self):
+        """ Loading a snapshot that has lost its tail fails with ValueError; a store cannot be passed to load. """
+        self.memory.alloc(4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "chip.snapshot"
+            self.memory.save(path)
+            with self.assertRaises(TypeError):
+                Memory.load(path, store="list")
+            path.write_bytes(path.read_bytes()[:-8])
+            with self.assertRaises(ValueError):
+                Memory.load(path)
+
+    def memory_with_string(self, memory_string, **options):
         """ Generates a Memory instance whose RAM contents matches the pattern decsribed by memory_string.
 
         This is a convenience method, allowing the quick and easy creation of Memory instances with a specific RAM
@@ -105,13 +453,14 @@ class TestMemory(unittest.TestCase):
 
             sample_memory_string = "NNNNN -100 7 ✗ ✗ ✗ ✗ ✗ -1 8 ✔ ✔ ✔ ✔ ✔ ✔ -100 5 ✗ ✗ ✗ 12 7 ✔ ✔ ✔ ✔ ✔"
 
+        :param options: any further keyword arguments are passed on to Memory.
         :return: A Memory instance with a RAM chip with a pattern of fragmentation that exactly matches that described
         by memory_string.
         """
         heap_ptr = memory_string.find(" ")
         ram = [None] * heap_ptr + memory_string.split(" ")[1:]
 
-        memory = Memory(size=len(ram), heap_ptr=heap_ptr)
+        memory = Memory(size=len(ram), heap_ptr=heap_ptr, store=self.store, policy=self.policy, **options)
 
         # Figure out the order of allocations
         free_segments = []
@@ -190,6 +539,92 @@ class TestMemory(unittest.TestCase):
         self.assertEqual("{:short}".format(memory), after_defrag)
         self.assertEqual(memory._free, 12)
 
+    # Coalescing
+
+    def test_coalescing_dealloc(self):
+        """ With coalesce=True, deAlloc merges the released segment with free neighbours on both sides. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, coalesce=True)
+        a, b, c, d = memory.alloc(7), memory.alloc(10), memory.alloc(4), memory.alloc(8)
+        memory.deAlloc(b)
+        memory.deAlloc(d)
+        self.assertEqual(memory._free_list, [43, 5])
+        self.assertEqual(memory._peek(6), 32)
+        memory.deAlloc(c)
+        self.assertEqual(memory._free_list, [5])
+        self.assertEqual(memory._peek(5), -1)
+        self.assertEqual(memory._peek(6), 50)
+        self.assertEqual(memory._read_segment(5), ["✔"] * 48)
+        memory.deAlloc(a)
+        self.assertEqual("{:short}".format(memory), "NNNNN -1 59" + " ✔" * 57)
+        self.assertFalse(memory.needs_repairs())
+
+    def test_random_coalescing(self):
+        """ Random alloc and deAlloc calls on a coalescing memory leave a consistent chip, with no two free segments
+        side by side, after every operation. """
+        memory = Memory(size=128, heap_ptr=5, store=self.store, policy=self.policy, coalesce=True)
+        allocated = []
+        for _ in range(500):
+            if allocated and random.random() < 0.4:
+                memory.deAlloc(allocated.pop(random.randrange(0, len(allocated))))
+            else:
+                ptr = memory.alloc(random.randrange(1, 8))
+                if ptr is not None:
+                    allocated.append(ptr)
+            self.assertFalse(memory.needs_repairs())
+            for seg_base in memory._free_list:
+                self.assertNotIn(seg_base + memory._peek(seg_base + 1), memory._free_list)
+
+    def test_defrag_step(self):
+        """ Defragmenting one segment at a time keeps the chip consistent, and ends with the same segments as defrag. """
+        before_defrag = "NNNNN -100 3 ✗ 20 3 ✔ 29 3 ✔ 8 3 ✔ -100 3 ✗ 11 3 ✔ -100 3 ✗ -1 3 ✔ 26 3 ✔"
+        expected = self.memory_with_string(before_defrag)
+        expected.defrag()
+        memory = self.memory_with_string(before_defrag)
+        steps = 1
+        while not memory.defrag_step(1):
+            self.assertFalse(memory.needs_repairs())
+            steps += 1
+        self.assertFalse(memory.needs_repairs())
+        self.assertEqual(steps, 7)
+        self.assertEqual(sorted(memory._free_list), sorted(expected._free_list))
+        self.assertEqual([memory._peek(i) for i in range(5, 32) if memory._peek(i) != -100 and i not in memory._back],
+                         [expected._peek(i) for i in range(5, 32) if expected._peek(i) != -100 and i not in expected._back])
+
+    def test_defrag_step_interleaved(self):
+        """ alloc and deAlloc calls can be made between calls to defrag_step. """
+        memory = self.memory_with_string("NNNNN -100 4 ✗ ✗ 19 5 ✔ ✔ ✔ 9 5 ✔ ✔ ✔ -1 10 ✔ ✔ ✔ ✔ ✔ ✔ ✔ ✔ -100 3 ✗")
+        self.assertFalse(memory.defrag_step(2))
+        self.assertEqual(memory._peek(10), 10)
+        ptr = memory.alloc(3)
+        memory.deAlloc(7)
+        self.assertTrue(memory.defrag_step(4))
+        self.assertFalse(memory.needs_repairs())
+        memory.deAlloc(ptr)
+        memory.defrag_step(100)
+        self.assertEqual(memory._free_list, [5])
+        self.assertFalse(memory.needs_repairs())
+
+    def test_auto_defrag(self):
+        """ With auto_defrag=True, an alloc request that would otherwise fail triggers defragmentation. """
+        memory = self.memory_with_string("NNNNN -100 4 ✗ ✗ 19 5 ✔ ✔ ✔ 9 5 ✔ ✔ ✔ -1 10 ✔ ✔ ✔ ✔ ✔ ✔ ✔ ✔ -100 3 ✗",
+                                         auto_defrag=True)
+        self.assertEqual(memory.alloc(15), 14)
+        self.assertIsNone(memory.alloc(15))
+        self.assertFalse(memory.needs_repairs())
+
+    def test_auto_defrag_from_mid_heap(self):
+        """ Auto-defragmentation that starts part way along the heap gives up once it has covered the whole heap. """
+        memory = Memory(size=64, heap_ptr=5, store=self.store, policy=self.policy, auto_defrag=True)
+        ptrs = [memory.alloc(5) for _ in range(0, 6)]
+        memory.deAlloc(ptrs[1])
+        memory.deAlloc(ptrs[3])
+        memory.defrag_step(2)
+        self.assertGreater(memory._defrag_cursor, 5)
+        self.assertIsNone(memory.alloc(25))
+        self.assertEqual(memory.alloc_many([25]), [None])
+        self.assertEqual(memory.realloc(ptrs[0], 25), (None, False))
+        self.assertFalse(memory.needs_repairs())
+
     def test_random_alloc_dealloc(self):
         """ Executes a random assotment of fifty alloc and deAlloc calls, then checks whether or not the ram-chip is in
         a consistent state. Does this two-hundred times. """
@@ -235,5 +670,147 @@ class TestMemory(unittest.TestCase):
             iterations_counter += 1
 
 
+class TestMemoryScaling(unittest.TestCase):
+    """ Guards against work that grows faster than the heap. """
+
+    @staticmethod
+    def defrag_seconds(heap_size):
+        """ Returns the shortest of three timings of defrag on a heap in which every other 100 register block is free. """
+        timings = []
+        for _ in range(0, 3):
+            memory = Memory(size=heap_size + 5, heap_ptr=5, log_capacity=0, markers=False)
+            ptrs = [memory.alloc(98) for _ in range(0, heap_size // 100)]
+            memory.dealloc_many(ptrs[::2])
+            started = time.perf_counter()
+            memory.defrag()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def test_defrag_scales_linearly(self):
+        """ Quadrupling the heap does not multiply the time taken by defrag sixteen-fold. """
+        self.assertLess(self.defrag_seconds(400000), 10 * self.defrag_seconds(100000))
+
+
+class TestMemoryArrayStore(TestMemory):
+    """ Re-runs every test in TestMemory against a ram-chip modelled by a typed array rather than a list. """
+
+    store = "array"
+
+    def test_write_segment(self):
+        """ Writing to a specific part of the ram-chip (typed stores only hold integers and markers) """
+        ptr = self.memory.alloc(15)
+        self.memory._write_segment(ptr - 2, 7)
+        self.assertEqual(self.memory._read_segment(ptr - 2), [7] * 15)
+        with self.assertRaises(TypeError):
+            self.memory._write_segment(ptr - 2, "a")
+
+    def test_reserved_codes(self):
+        """ Integers that collide with the store's sentinel codes are rejected. """
+        with self.assertRaises(ValueError):
+            self.memory._poke(10, -(2 ** 63))
+
+    def test_markers_round_trip(self):
+        """ None and the two marker strings survive a trip through the typed store. """
+        self.assertIsNone(self.memory._peek(0))
+        self.assertEqual(self.memory._peek(7), "✔")
+        ptr = self.memory.alloc(3)
+        self.assertEqual(self.memory._peek(ptr), "✗")
+        self.assertEqual(str(self.memory), str(self.memory_with_string("{:short}".format(self.memory))))
+
+
+class TestMemoryPagedStore(TestMemory):
+    """ Re-runs every test in TestMemory against a ram-chip modelled by a paged store, with pages of 8 registers. """
+
+    store = "paged"
+
+    def setUp(self):
+        patcher = mock.patch.object(PagedStore, "PAGE_SIZE", 8)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_lazy_pages(self):
+        """ Only the pages that have been written to are materialised. """
+        memory = Memory(size=10 ** 9, heap_ptr=5, store="paged")
+        self.assertEqual(memory._ram.materialised_pages, 1)
+        self.assertEqual(memory._peek(10 ** 9 - 1), "✔")
+        ptr = memory.alloc(3)
+        self.assertEqual(memory._ram.materialised_pages, 2)
+        memory.deAlloc(ptr)
+        self.assertFalse(memory.needs_repairs(fast=True))
+
+    def test_fill_whole_pages(self):
+        """ Filling whole pages discards them, leaving their registers implied. """
+        ptr = self.memory.alloc(40)
+        self.assertEqual(self.memory._ram.materialised_pages, 2)
+        self.assertEqual(self.memory._read_segment(ptr - 2), ["✗"] * 40)
+        self.memory.deAlloc(ptr)
+        self.assertEqual(self.memory._read_segment(ptr - 2), ["✔"] * 40)
+        self.assertEqual(self.memory._ram[ptr - 2: ptr + 40: 7], [5, "✔", "✔", "✔", "✔", "✔"])
+
+
+class TestMemoryNextFit(TestMemory):
+    """ Re-runs every test in TestMemory using the next-fit allocation policy. """
+
+    policy = "next-fit"
+
+    def test_rover(self):
+        """ Searches resume from the segment that serviced the previous request. """
+        memory = self.memory_with_string("NNNNN 14 6 ✔ ✔ ✔ ✔ -100 3 ✗ 23 6 ✔ ✔ ✔ ✔ -100 3 ✗ -1 6 ✔ ✔ ✔ ✔ -100 3 ✗")
+        self.assertEqual(memory._free_list, [5, 14, 23])
+        self.assertEqual(memory.alloc(4), 7)
+        memory.deAlloc(7)
+        self.assertEqual(memory._free_list, [5, 14, 23])
+        self.assertEqual(memory.alloc(4), 16)
+        self.assertEqual(memory.alloc(4), 25)
+        self.assertEqual(memory.alloc(4), 7)
+        self.assertIsNone(memory.alloc(4))
+        self.assertFalse(memory.needs_repairs())
+
+
+class TestMemoryBestFit(TestMemory):
+    """ Re-runs every test in TestMemory using the best-fit allocation policy. """
+
+    policy = "best-fit"
+
+    def test_smallest_segment_wins(self):
+        """ The smallest segment that can service a request is chosen, regardless of its place in the free list. """
+        memory = self.memory_with_string("NNNNN 19 7 ✔ ✔ ✔ ✔ ✔ -1 4 ✔ ✔ -100 3 ✗ 12 5 ✔ ✔ ✔ -100 3 ✗ 5 6 ✔ ✔ ✔ ✔")
+        self.assertEqual(memory.alloc(3), 21)
+        self.assertEqual(memory.alloc(4), 29)
+        self.assertEqual(memory.alloc(2), 14)
+        self.assertFalse(memory.needs_repairs())
+
+
+class TestMemoryWorstFit(TestMemory):
+    """ Re-runs every test in TestMemory using the worst-fit allocation policy. """
+
+    policy = "worst-fit"
+
+    def test_largest_segment_wins(self):
+        """ The largest free segment is always chosen. """
+        memory = self.memory_with_string("NNNNN 19 7 ✔ ✔ ✔ ✔ ✔ -1 4 ✔ ✔ -100 3 ✗ 12 5 ✔ ✔ ✔ -100 3 ✗ 5 6 ✔ ✔ ✔ ✔")
+        self.assertEqual(memory.alloc(1), 11)
+        self.assertEqual(memory.alloc(4), 29)
+        self.assertIsNone(memory.alloc(4))
+        self.assertFalse(memory.needs_repairs())
+
+
+class TestMemorySegregated(TestMemory):
+    """ Re-runs every test in TestMemory using segregated size-class free lists. """
+
+    policy = "segregated"
+
+    def test_larger_class_used_when_own_class_empty(self):
+        """ A request that cannot be met from its own size class is serviced from the next non-empty class. """
+        memory = self.memory_with_string("NNNNN -1 6 ✔ ✔ ✔ ✔ -100 3 ✗ 5 12 ✔ ✔ ✔ ✔ ✔ ✔ ✔ ✔ ✔ ✔ -100 3 ✗")
+        self.assertEqual(memory._free_list, [14, 5])
+        self.assertEqual(memory.alloc(4), 7)
+        self.assertEqual(memory.alloc(4), 22)
+        self.assertEqual(memory.alloc(4), 16)
+        self.assertIsNone(memory.alloc(4))
+        self.assertFalse(memory.needs_repairs())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,125 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with parallel.py """
+
+import sys
+import os.path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import random
+from concurrent.futures import ProcessPoolExecutor
+from source.parallel import ParallelSweeper
+from source.shared import SharedMemory
+
+
+class TestParallelSweeper(unittest.TestCase):
+
+    options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        """ Sets up two identical, fragmented chips in shared memory: one to be swept sequentially, and one in
+        parallel. """
+        self.chips = [SharedMemory(size=3000, heap_ptr=10, **self.options) for _ in range(0, 2)]
+        for chip in self.chips:
+            rng = random.Random(24)
+            ptrs = []
+            while True:
+                ptr = chip.alloc(rng.randrange(1, 40))
+                if ptr is None:
+                    break
+                ptrs.append(ptr)
+            for ptr in rng.sample(ptrs, len(ptrs) * 2 // 3):
+                chip.deAlloc(ptr)
+        self.sweeper = ParallelSweeper(self.chips[1], regions=5, executor=self.executor)
+
+    def tearDown(self):
+        self.sweeper.close()
+        for chip in self.chips:
+            chip.close()
+            chip.unlink()
+
+    def assertSameChips(self):
+        sequential, parallel = (chip.memory for chip in self.chips)
+        self.assertEqual(list(parallel._ram), list(sequential._ram))
+        self.assertEqual(parallel._free_list, sequential._free_list)
+        self.assertEqual(parallel.metrics._replace(defrag_seconds=0), sequential.metrics._replace(defrag_seconds=0))
+
+    def test_regions(self):
+        """ The heap is cut into regions at segment boundaries. """
+        memory = self.chips[1].memory
+        starts = self.sweeper._starts(memory)
+        self.assertEqual(len(starts), 5)
+        self.assertEqual(starts[0], 10)
+        segments = set(memory._allocated) | set(memory._free_list)
+        self.assertTrue(all(start in segments for start in starts))
+
+    def test_needs_repairs(self):
+        """ A healthy chip passes the parallel check, with the same results as the sequential check. """
+        memory = self.chips[1].memory
+        self.assertFalse(self.sweeper.needs_repairs())
+        self.assertEqual(self.sweeper._health_check(memory), memory._health_check())
+
+    def test_needs_repairs_damaged(self):
+        """ The parallel check reports the same problems as the sequential check. """
+        memory = self.chips[1].memory
+        seg_base = self.sweeper._starts(memory)[3]
+        for damage in (memory._ram[seg_base + 1] + 1, 2, None):
+            memory._ram[seg_base + 1] = damage
+            self.assertTrue(self.sweeper.needs_repairs())
+            self.assertEqual(self.sweeper._health_check(memory), memory._health_check())
+
+    def test_needs_repairs_stale_tables(self):
+        """ Tables that disagree with the chip are reported, as they are by the sequential check. """
+        memory = self.chips[1].memory
+        memory._free_registers += 1
+        self.assertTrue(self.sweeper.needs_repairs())
+        self.assertEqual(self.sweeper._health_check(memory), memory._health_check())
+
+    def test_defrag(self):
+        """ A parallel defrag leaves the chip exactly as a sequential defrag does. """
+        self.chips[0].defrag()
+        self.sweeper.defrag()
+        self.assertSameChips()
+        self.assertFalse(self.sweeper.needs_repairs())
+        self.assertEqual(self.chips[1].alloc(100), self.chips[0].alloc(100))
+
+    def test_defrag_across_seams(self):
+        """ Runs of free segments that straddle one or more seams are merged, as they are by a sequential defrag. """
+        for chip in self.chips:
+            memory = chip.memory
+            for seg_base in list(memory._allocated)[10: -10]:
+                chip.deAlloc(seg_base + 2)
+        self.chips[0].defrag()
+        self.sweeper.defrag()
+        self.assertSameChips()
+        self.assertFalse(self.sweeper.needs_repairs())
+
+    def test_defrag_single_region(self):
+        """ A sweeper with a single region does all of the work in one worker. """
+        self.chips[0].defrag()
+        with ParallelSweeper(self.chips[1], processes=1, executor=self.executor) as sweeper:
+            sweeper.defrag()
+        self.assertSameChips()
+
+
+class TestParallelSweeperNoMarkers(TestParallelSweeper):
+    """ Repeats the tests for chips whose data-registers are not marked, so that headers are found by walking. """
+
+    options = {"markers": False}
+
+
+if __name__ == '__main__':
+    unittest.main()
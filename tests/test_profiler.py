@@ -0,0 +1,118 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with profiler.py """
+
+import sys
+import os.path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import json
+import tempfile
+from pathlib import Path
+from source.memory import Memory
+from source.profiler import AllocationProfiler
+from source.slab import SlabCache
+
+
+class TestAllocationProfiler(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up a memory 64 registers long, with a profiler attached. """
+        self.memory = Memory(size=64, heap_ptr=5)
+        self.profiler = AllocationProfiler(self.memory)
+
+    def tearDown(self):
+        self.profiler.close()
+
+    def small(self):
+        return self.memory.alloc(3)
+
+    def large(self):
+        return self.memory.alloc(20)
+
+    def stats(self):
+        """ Returns the profiler's results keyed by function name. """
+        return {stat.site.rsplit(" ", 1)[1].strip("()"): stat for stat in self.profiler.report()}
+
+    def test_sites(self):
+        """ Allocations are attributed to the functions that asked for them, live blocks are counted, and the lifetimes
+        of released blocks are recorded. """
+        smalls = [self.small() for _ in range(0, 3)]
+        large = self.large()
+        self.memory.deAlloc(smalls[0])
+        stats = self.stats()
+        self.assertEqual(stats["small"][1:6], (3, 9, 2, 6, 0))
+        self.assertEqual(stats["large"][1:6], (1, 20, 1, 20, 0))
+        self.assertEqual(sum(count for (_, count) in stats["small"].lifetimes), 1)
+        self.assertEqual(stats["large"].lifetimes, ())
+        self.assertIn(os.path.basename(__file__), stats["small"].site)
+        self.assertEqual(self.profiler.report()[0], stats["large"])  # Most live registers first
+        self.memory.dealloc_many([large] + smalls[1:])
+        self.assertEqual(self.stats()["large"].live_registers, 0)
+
+    def test_failures(self):
+        """ Failed requests are counted against their site. """
+        self.large()
+        self.large()
+        self.assertIsNone(self.large())
+        stats = self.stats()["large"]
+        self.assertEqual((stats.allocs, stats.failures), (2, 1))
+
+    def test_batches_and_layers(self):
+        """ Allocations made through alloc_many, or through objects layered on the memory, are attributed to the
+        client code that made them. """
+        ptrs = self.memory.alloc_many([3, 4])
+        cache = SlabCache(self.memory, sizes=(2,), slots_per_slab=4)
+        cache.alloc(2)
+        stats = [stat for stat in self.profiler.report() if stat.site.endswith("(test_batches_and_layers)")]
+        self.assertEqual([(stat.allocs, stat.registers, stat.live_blocks) for stat in stats], [(1, 8, 1), (2, 7, 2)])
+        self.memory.deAlloc(ptrs[0])
+
+    def test_sampling(self):
+        """ Only one allocation in every sample_every is profiled; releases of other blocks are ignored. """
+        self.profiler.close()
+        self.profiler = AllocationProfiler(self.memory, sample_every=3)
+        ptrs = [self.small() for _ in range(0, 6)]
+        for ptr in ptrs:
+            self.memory.deAlloc(ptr)
+        stats = self.stats()["small"]
+        self.assertEqual((stats.allocs, stats.live_blocks), (2, 0))
+        self.assertEqual(sum(count for (_, count) in stats.lifetimes), 2)
+        with self.assertRaises(ValueError):
+            AllocationProfiler(self.memory, sample_every=0)
+
+    def test_close_and_reset(self):
+        """ A closed profiler sees no more calls; a reset one forgets what it has seen. """
+        self.small()
+        self.profiler.reset()
+        self.assertEqual(self.profiler.report(), [])
+        self.profiler.close()
+        self.small()
+        self.assertEqual(self.profiler.report(), [])
+        self.profiler = AllocationProfiler(self.memory)
+
+    def test_lifetime_buckets(self):
+        """ Lifetime buckets double in width. """
+        self.assertEqual([AllocationProfiler._lifetime_bucket(ns) for ns in (0, 1, 2, 3, 4, 1000)],
+                         [1, 2, 4, 4, 8, 1024])
+
+    def test_export(self):
+        """ The report can be exported as JSON. """
+        self.small()
+        self.large()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "profile.json"
+            self.profiler.export(path)
+            with open(path.as_posix()) as report_file:
+                exported = json.load(report_file)
+        self.assertEqual(exported["sample_every"], 1)
+        self.assertEqual([site["registers"] for site in exported["sites"]], [20, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with replay.py """
+
+import sys
+import os.path
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest import mock
+from source.memory import Memory, Alloc, Dealloc
+from source.replay import TRACE_KINDS, read_trace, replay, synthetic_trace, write_trace
+from pathlib import Path
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up a Memory object, and makes a handful of calls to it. """
+        self.memory = Memory(size=64, heap_ptr=5)
+        a = self.memory.alloc(7)
+        b = self.memory.alloc(10)
+        self.memory.alloc(40)
+        self.memory.deAlloc(a)
+        self.memory.alloc(4)
+        self.memory.deAlloc(b)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "trace.txt"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_log(self):
+        """ A Memory log (most recent call first) can be read as a trace. """
+        with open(self.path.as_posix(), "w") as trace_file:
+            trace_file.write(self.memory.status_report())
+        self.assertEqual(read_trace(self.path), [Alloc(7, 57), Alloc(10, 45), Alloc(40, -1), Dealloc(57), Alloc(4, 60),
+                                                 Dealloc(45)])
+
+    def test_round_trip(self):
+        """ A trace written by write_trace reads back unchanged. """
+        events = synthetic_trace("churn", 100)
+        write_trace(events, self.path)
+        self.assertEqual(read_trace(self.path), events)
+
+    def test_replay_reproduces_chip(self):
+        """ Replaying a memory's log against a fresh memory of the same size reproduces the original chip. """
+        with open(self.path.as_posix(), "w") as trace_file:
+            trace_file.write(self.memory.log)
+        memory = Memory(size=64, heap_ptr=5)
+        report = replay(memory, read_trace(self.path))
+        self.assertEqual("{:short}".format(memory), "{:short}".format(self.memory))
+        self.assertEqual(report.ops, 6)
+        self.assertEqual(report.failures, 1)
+        self.assertEqual(report.failure_rate, 0.25)
+
+    def test_replay_remaps_addresses(self):
+        """ Recorded addresses are mapped to the pointers returned during the replay. """
+        memory = Memory(size=64, heap_ptr=5)
+        report = replay(memory, [Alloc(3, 1000), Alloc(3, 2000), Dealloc(1000), Dealloc(3000)])
+        self.assertEqual(report.ops, 3)
+        self.assertEqual(memory._free_list, [59, 5])
+        self.assertGreater(report.peak_fragmentation, 0)
+        self.assertFalse(memory.needs_repairs())
+
+    def test_sampling_not_timed(self):
+        """ The time spent measuring fragmentation is not counted towards the throughput of the memory. """
+        def slow_fragmentation(memory):
+            time.sleep(0.01)
+            return 0.0
+
+        memory = Memory(size=128, heap_ptr=5)
+        with mock.patch("source.replay.fragmentation", side_effect=slow_fragmentation):
+            report = replay(memory, synthetic_trace("churn", 20, live=4, seed=1), sample_every=1)
+        self.assertLess(report.seconds, 0.1)  # Sampling alone takes at least 0.2 seconds
+
+    def test_synthetic_traces(self):
+        """ Synthetic traces are reproducible, and every one of them can be replayed without damaging the chip. """
+        for kind in TRACE_KINDS:
+            events = synthetic_trace(kind, 500, live=8, seed=1)
+            self.assertEqual(events, synthetic_trace(kind, 500, live=8, seed=1))
+            self.assertEqual(len(events), 500)
+            memory = Memory(size=128, heap_ptr=5)
+            report = replay(memory, events)
+            self.assertLessEqual(report.latency_ns["p50"], report.latency_ns["max"])
+            self.assertFalse(memory.needs_repairs())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with sharded.py """
+
+import sys
+import os.path
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import random
+from unittest import mock
+from source.sharded import ShardedMemory
+from source.store import PagedStore
+
+
+class TestShardedMemory(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up a ShardedMemory object which will manage a ram-chip 85 registers long, in four shards. """
+        self.memory = ShardedMemory(size=85, heap_ptr=5, shards=4)
+
+    def test_startup(self):
+        """ Is each shard set up correctly? """
+        self.assertEqual([shard.stack_size for shard in self.memory.shards], [5, 25, 45, 65])
+        self.assertEqual([shard.heap_size for shard in self.memory.shards], [20] * 4)
+        self.assertEqual(self.memory.heap_size, 80)
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_overflow_to_other_shards(self):
+        """ When the home shard is full, requests are serviced by the other shards. """
+        ptrs = [self.memory.alloc(16) for _ in range(0, 5)]
+        self.assertEqual(ptrs[:4], [7, 27, 47, 67])
+        self.assertIsNone(ptrs[4])
+        self.assertFalse(self.memory.needs_repairs())
+
+    def test_cross_shard_dealloc(self):
+        """ Memory released by any thread is returned to the shard that owns it. """
+        ptrs = [self.memory.alloc(16) for _ in range(0, 4)]
+        freer = threading.Thread(target=lambda: [self.memory.deAlloc(ptr) for ptr in ptrs])
+        freer.start()
+        freer.join()
+        self.assertEqual([shard._free_list for shard in self.memory.shards], [[5], [25], [45], [65]])
+        self.assertEqual([self.memory.shard_of(ptr) for ptr in ptrs], [0, 1, 2, 3])
+
+    def churn(self, memory):
+        """ Has several threads allocate and release memory at once, then checks that every shard is consistent. """
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            held = []
+            try:
+                for _ in range(0, 2000):
+                    if held and rng.random() < 0.45:
+                        memory.deAlloc(held.pop(rng.randrange(0, len(held))))
+                    else:
+                        ptr = memory.alloc(rng.randrange(1, 12))
+                        if ptr is not None:
+                            held.append(ptr)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertFalse(memory.needs_repairs())
+
+    def test_concurrent_alloc_dealloc(self):
+        """ Several threads allocating and releasing memory at once leave every shard in a consistent state. """
+        self.churn(ShardedMemory(size=4005, heap_ptr=5, shards=4))
+
+    def test_concurrent_paged_store(self):
+        """ Shards can share a paged store, even when pages straddle the boundaries between shards. """
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads as often as possible, to shake out races
+        self.addCleanup(sys.setswitchinterval, interval)
+        with mock.patch.object(PagedStore, "PAGE_SIZE", 7):
+            self.churn(ShardedMemory(size=4005, heap_ptr=5, shards=4, store="paged"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with shared.py """
+
+import sys
+import os.path
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import unittest
+from source.shared import SharedMemory
+
+WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+from source.shared import SharedMemory
+chip = SharedMemory.attach({name!r})
+ptrs = [chip.alloc(size) for size in (4, 6, 8)]
+chip.deAlloc(ptrs[1])
+print(ptrs[0], ptrs[2])
+chip.close()
+"""
+
+
+class TestSharedMemory(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up a chip 64 registers long in shared memory. """
+        self.chip = SharedMemory(size=64, heap_ptr=5)
+
+    def tearDown(self):
+        self.chip.close()
+        self.chip.unlink()
+
+    def run_worker(self):
+        """ Runs WORKER in a separate process, returning the pointers it prints. """
+        output = subprocess.run([sys.executable, "-c", WORKER.format(root=ROOT, name=self.chip.name)],
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        return [int(ptr) for ptr in output.split()]
+
+    def test_attach_in_same_process(self):
+        """ A second handle on the chip sees changes made through the first. """
+        other = SharedMemory.attach(self.chip.name)
+        ptr = self.chip.alloc(15)
+        self.assertEqual(ptr, 49)
+        self.assertEqual(other.alloc(15), 32)
+        self.chip.deAlloc(32)
+        self.assertEqual(other.memory._free_list, [5])
+        self.assertFalse(other.needs_repairs())
+        self.assertEqual(other.memory._free_list, [30, 5])
+        other.close()
+
+    def test_other_process(self):
+        """ Memory allocated and released by another process is visible to this one. """
+        ptr = self.chip.alloc(10)
+        first, last = self.run_worker()
+        self.assertEqual((ptr, first, last), (54, 48, 30))
+        self.assertFalse(self.chip.needs_repairs())
+        self.assertEqual(self.chip.memory._free_list, [38, 5])
+        self.chip.deAlloc(first)
+        self.chip.deAlloc(last)
+        self.chip.deAlloc(ptr)
+        self.chip.defrag()
+        self.assertEqual(self.chip.memory._free_list, [5])
+
+    def test_uninitialised_registers(self):
+        """ Registers that have never been written to read back as None, just as they do on any other chip. """
+        chip = SharedMemory(size=64, heap_ptr=5, markers=False)
+        self.assertEqual(chip.memory._ram[0:5], [None] * 5)
+        self.assertTrue("{:short}".format(chip.memory).startswith("NNNNN -1 59N"))
+        self.assertTrue("{:short}".format(self.chip.memory).startswith("NNNNN -1 59 ✔"))
+        chip.close()
+        chip.unlink()
+
+    def test_attach_holds_lock(self):
+        """ An attaching process builds its tables from the chip while holding the shared lock. """
+        entered = []
+
+        class RecordingLock:
+            def __enter__(lock):
+                entered.append(lock)
+
+            def __exit__(lock, *exc_info):
+                pass
+
+        other = SharedMemory.attach(self.chip.name, lock=RecordingLock())
+        self.assertEqual(len(entered), 1)
+        other.close()
+
+    def test_unlink_removes_lock_file(self):
+        """ Unlinking a chip also deletes its lock file. """
+        chip = SharedMemory(size=64, heap_ptr=5)
+        path = chip._lock._path
+        self.assertTrue(os.path.exists(path))
+        chip.close()
+        chip.unlink()
+        self.assertFalse(os.path.exists(path))
+
+    def test_attach_to_unknown_block(self):
+        """ Attaching to a block that does not exist fails. """
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory.attach("no-such-chip-here")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with slab.py """
+
+import sys
+import os.path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import random
+from source.memory import Memory
+from source.slab import SlabCache, SlabStats
+
+
+class TestSlabCache(unittest.TestCase):
+
+    def setUp(self):
+        """ Sets up a slab cache (classes of 4 and 8 registers, four slots per slab) in front of a 128 register chip. """
+        self.memory = Memory(size=128, heap_ptr=5)
+        self.cache = SlabCache(self.memory, sizes=(8, 4), slots_per_slab=4)
+
+    def test_slots_are_carved_from_a_slab(self):
+        """ The first request for a class allocates a slab; the following requests are met from its slots. """
+        ptrs = [self.cache.alloc(3) for _ in range(0, 4)]
+        self.assertEqual(ptrs, [112, 116, 120, 124])
+        self.assertEqual(self.memory._free_list, [5])
+        self.assertEqual(self.cache.stats[4], SlabStats(hits=3, misses=1, slabs=1, free_slots=0))
+        self.assertEqual(self.cache.alloc(4), 94)
+        self.assertEqual(self.cache.stats[4], SlabStats(hits=3, misses=2, slabs=2, free_slots=3))
+        self.assertFalse(self.cache.needs_repairs())
+
+    def test_large_requests_bypass_the_cache(self):
+        """ Requests larger than every size class go straight to the memory. """
+        self.assertEqual(self.cache.alloc(9), 119)
+        self.cache.deAlloc(119)
+        self.assertEqual(self.memory._free_list, [117, 5])
+        self.assertEqual(self.cache.stats[8], SlabStats(0, 0, 0, 0))
+
+    def test_drained_slabs_are_returned(self):
+        """ A slab whose slots have all been released goes back to the memory. """
+        ptrs = [self.cache.alloc(6) for _ in range(0, 5)]
+        self.assertEqual(self.cache.stats[8].slabs, 2)
+        self.cache.deAlloc(ptrs[4])
+        self.assertEqual(self.cache.stats[8], SlabStats(hits=3, misses=2, slabs=1, free_slots=0))
+        self.assertEqual(len(self.memory._free_list), 2)
+        for ptr in ptrs[:4]:
+            self.cache.deAlloc(ptr)
+        self.assertEqual(self.cache.stats[8].slabs, 0)
+        self.memory.defrag()
+        self.assertEqual(self.memory._free_list, [5])
+
+    def test_double_free(self):
+        """ Releasing a slot twice is refused, and leaves the slab and its other slots untouched. """
+        ptrs = [self.cache.alloc(3) for _ in range(0, 2)]
+        self.cache.deAlloc(ptrs[0])
+        with self.assertRaises(ValueError):
+            self.cache.deAlloc(ptrs[0])
+        self.assertEqual(self.cache.stats[4], SlabStats(hits=1, misses=1, slabs=1, free_slots=3))
+        self.cache.deAlloc(ptrs[1])
+        self.assertEqual(self.cache.stats[4].slabs, 0)
+        self.assertEqual(self.memory._free_list, [110, 5])
+        self.assertFalse(self.cache.needs_repairs())
+
+    def test_exhausted_memory(self):
+        """ A request fails when a new slab is needed but the memory cannot provide one. """
+        self.assertIsNotNone(self.memory.alloc(110))
+        self.assertIsNone(self.cache.alloc(8))
+        self.assertEqual(self.cache.stats[8], SlabStats(hits=0, misses=1, slabs=0, free_slots=0))
+
+    def test_random_alloc_dealloc(self):
+        """ Slots are never handed out twice, and releasing everything returns every slab. """
+        rng = random.Random(15)
+        live = set()
+        for _ in range(0, 400):
+            if live and rng.random() < 0.5:
+                ptr = rng.choice(sorted(live))
+                live.remove(ptr)
+                self.cache.deAlloc(ptr)
+            else:
+                ptr = self.cache.alloc(rng.randint(1, 10))
+                if ptr is not None:
+                    self.assertNotIn(ptr, live)
+                    live.add(ptr)
+        for ptr in live:
+            self.cache.deAlloc(ptr)
+        self.assertEqual([stats.slabs for stats in self.cache.stats.values()], [0, 0])
+        self.memory.defrag()
+        self.assertEqual(self.memory._free_list, [5])
+        self.assertFalse(self.cache.needs_repairs())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/Library/Frameworks/Python.framework/Versions/3.4/bin/python3.4
+# -*- coding utf-8 -*-
+
+__author__ = 'paulpatterson'
+
+""" A test class to be used in conjunction with view.py """
+
+import sys
+import os.path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from source.memory import Memory
+from source.store import TICK, CROSS
+
+
+class TestSegmentView(unittest.TestCase):
+
+    store = "list"
+
+    def setUp(self):
+        """ Sets up a Memory object which will manage a ram-chip 64 registers long, with a block of 6 registers. """
+        self.memory = Memory(size=64, heap_ptr=5, store=self.store)
+        self.ptr = self.memory.alloc(6)
+        self.view = self.memory.view(self.ptr)
+
+    def test_reads_and_writes_in_place(self):
+        """ Changes made through a view are made to the chip itself, and vice versa. """
+        self.assertEqual(len(self.view), 6)
+        self.view[0] = None
+        self.view[-1] = TICK
+        self.assertEqual(self.memory._read_segment(self.ptr - 2), [None] + [CROSS] * 4 + [TICK])
+        self.memory._poke(self.ptr + 1, None)
+        self.assertIsNone(self.view[1])
+        self.assertEqual(self.view.tolist(), list(self.view))
+
+    def test_slices(self):
+        """ Views support slicing and bulk assignment, but cannot change size. """
+        self.view[1:4] = [None] * 3
+        self.assertEqual(self.view[0:5:2], [CROSS, None, CROSS])
+        self.view[::2] = [TICK] * 3
+        self.assertEqual(self.view[:], [TICK, None, TICK, None, TICK, CROSS])
+        with self.assertRaises(ValueError):
+            self.view[1:3] = [None]
+
+    def test_bounds(self):
+        """ A view cannot reach beyond its segment. """
+        with self.assertRaises(IndexError):
+            self.view[6]
+        with self.assertRaises(IndexError):
+            self.view[-7] = None
+        self.assertEqual(len(self.view[4:100]), 2)
+        with self.assertRaises(ValueError):
+            self.memory.view(self.ptr + 1)
+
+    def test_stale_views(self):
+        """ A view goes stale when its segment is released or resized, even if the segment is reallocated. """
+        other = self.memory.view(self.memory.alloc(3))
+        self.memory.deAlloc(self.ptr)
+        self.assertFalse(self.view.valid)
+        with self.assertRaises(ValueError):
+            self.view[0]
+        with self.assertRaises(ValueError):
+            self.view[0] = None
+        self.assertEqual(self.memory.alloc(6), self.ptr)
+        self.assertFalse(self.view.valid)
+        view = self.memory.view(self.ptr)
+        self.assertTrue(view.valid)
+
+        self.assertTrue(other.valid)
+        self.memory.defrag()
+        self.assertTrue(other.valid)
+        self.assertEqual(self.memory.realloc(self.ptr, 2), (self.ptr, False))
+        self.assertFalse(view.valid)
+        self.assertEqual(len(self.memory.view(self.ptr)), 2)
+
+    def test_compaction_invalidates_moved_segments(self):
+        """ Views of segments moved by compact go stale. """
+        handle = self.memory.alloc_handle(4)
+        view = self.memory.view(self.memory.address(handle))
+        self.memory.deAlloc(self.memory.alloc(3))
+        self.memory.compact()
+        self.assertFalse(view.valid)
+        self.assertTrue(self.view.valid)
+        self.assertEqual(len(self.memory.view(self.memory.address(handle))), 4)
+
+
+class TestSegmentViewArrayStore(TestSegmentView):
+
+    store = "array"
+
+
+if __name__ == '__main__':
+    unittest.main()